@@ -0,0 +1,121 @@
+import threading
+from collections import deque
+
+import runtime
+
+
+class Neighbour:
+    __slots__ = ('mac', 'updated')
+
+    def __init__(self, mac, updated):
+        self.mac = mac
+        self.updated = updated
+
+
+class PendingRequest:
+    __slots__ = ('packets', 'tries', 'next_try')
+
+    def __init__(self, max_packets):
+        self.packets = deque(maxlen=max_packets)
+        self.tries = 0
+        self.next_try = 0
+
+
+# ARP neighbour table of an interface.
+# Every IP has at most one outstanding request. Packets waiting for an address are queued per IP and handed back
+# all at once when the answer comes, the oldest packet is dropped when a queue is full. Requests are repeated every
+# retry_interval seconds up to max_tries times, then the waiting packets are dropped. Entries expire max_age seconds
+# after the neighbour was last heard from, any ARP message from it refreshes the entry.
+class NeighbourTable:
+    def __init__(self, max_pending=64, retry_interval=1, max_tries=3, max_age=300):
+        self.max_pending = max_pending
+        self.retry_interval = retry_interval
+        self.max_tries = max_tries
+        self.max_age = max_age
+        self.dropped = 0
+
+        self.__lock = threading.Lock()
+        self.__neighbours = {}
+        self.__pending = {}
+
+    def __len__(self):
+        return len(self.__neighbours)
+
+    # packets waiting for an address
+    def pending(self):
+        with self.__lock:
+            return sum(len(p.packets) for p in self.__pending.values())
+
+    def lookup(self, ip):
+        with self.__lock:
+            n = self.__neighbours.get(ip)
+            if n and runtime.time() - n.updated < self.max_age:
+                return n.mac
+
+        return None
+
+    # returns (mac, send_request), mac is None when the packet was queued until ip is resolved,
+    # send_request is True when a new request for ip has to go out
+    def resolve(self, ip, packet):
+        now = runtime.time()
+        with self.__lock:
+            n = self.__neighbours.get(ip)
+            if n:
+                if now - n.updated < self.max_age:
+                    return n.mac, False
+
+                del self.__neighbours[ip]
+
+            p = self.__pending.get(ip)
+            send_request = p is None
+            if send_request:
+                p = self.__pending[ip] = PendingRequest(self.max_pending)
+                p.tries = 1
+                p.next_try = now + self.retry_interval
+
+            if len(p.packets) == p.packets.maxlen:
+                self.dropped += 1
+            p.packets.append(packet)
+
+        return None, send_request
+
+    # stores the address and returns the packets which were waiting for it
+    def update(self, ip, mac):
+        with self.__lock:
+            self.__neighbours[ip] = Neighbour(mac, runtime.time())
+            p = self.__pending.pop(ip, None)
+
+        if p:
+            return list(p.packets)
+
+        return []
+
+    # returns the IPs whose requests have to be sent again, gives up on the ones which were tried too often
+    def expire(self):
+        now = runtime.time()
+        retry = []
+
+        with self.__lock:
+            for ip, p in list(self.__pending.items()):
+                if now < p.next_try:
+                    continue
+
+                if p.tries >= self.max_tries:
+                    self.dropped += len(p.packets)
+                    del self.__pending[ip]
+                    continue
+
+                p.tries += 1
+                p.next_try = now + self.retry_interval
+                retry.append(ip)
+
+            aged = [ip for ip, n in self.__neighbours.items() if now - n.updated >= self.max_age]
+            for ip in aged:
+                del self.__neighbours[ip]
+
+        return retry
+
+    def clear(self):
+        with self.__lock:
+            self.__neighbours = {}
+            self.__pending = {}
@@ -0,0 +1,245 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import bgp
+import clock
+import examples
+import router
+import runtime
+import tools
+import topology
+from bgproute import BGPRoute, interned
+from bgptable import BGPTable
+from topology import Topology
+
+SCENARIOS = ['conf1', 'conf2', 'conf3', 'conf4', 'conf5', 'conf6', 'conf7', 'conf8', 'conf9']
+SYNTHETIC = ['ring:10', 'ring:25', 'random:25', 'random:50', 'random:100', 'tiered:100', 'waxman:100']
+
+
+# Watches every router of the process while a scenario runs, times are seconds on the runtime clock since start.
+#   first_established - the first BGP session got ESTABLISHED
+#   all_established   - every session of every router which is on was ESTABLISHED at once
+#   converged         - every router which is on had a route to every network announced by the routers which are on
+#   events            - routers going off or on, with the time the routing tables stopped changing after each one,
+#                       None when they still changed at the end
+class Monitor:
+    def __init__(self, time_to_run, interval=0.5):
+        self.time_to_run = time_to_run
+        self.interval = interval
+
+        self.first_established = None
+        self.all_established = None
+        self.converged = None
+        self.events = []
+        self.routers = 0
+        self.sessions = 0
+
+        self.__states = {}
+        self.__changes = None
+        self.__change_times = []
+
+    def __sample(self, now):
+        routers = sorted(router.instances, key=lambda r: r.name)
+        self.routers = max(self.routers, len(routers))
+
+        for r in routers:
+            previous = self.__states.get(r.name)
+            if previous is not None and previous != r.state:
+                self.events.append({'router': r.name, 'event': 'on' if r.state else 'off', 'time': now})
+            self.__states[r.name] = r.state
+
+        changes = sum(r.counters['best_path_changes'] for r in routers)
+        if changes != self.__changes:
+            self.__changes = changes
+            self.__change_times.append(now)
+
+        on = [r for r in routers if r.state]
+        states = [s for r in on for s in r.get_bgp_states().values()]
+        self.sessions = max(self.sessions, len(states))
+
+        established = states.count('ESTABLISHED')
+        if established and self.first_established is None:
+            self.first_established = now
+        if states and established == len(states) and self.all_established is None:
+            self.all_established = now
+
+        if self.converged is None and on:
+            networks = set()
+            for r in on:
+                networks.update(r.get_bgp_networks())
+
+            if all(networks <= {(route.network, route.mask) for route in r.get_routing_table()} for r in on):
+                self.converged = now
+
+    # an event has reconverged at the last routing change before the next event
+    def __reconvergence(self):
+        for i, e in enumerate(self.events):
+            end = self.events[i + 1]['time'] if i + 1 < len(self.events) else float('inf')
+            changes = [t for t in self.__change_times if e['time'] <= t < end]
+            e['reconverged'] = round(changes[-1] - e['time'], 3) if changes else None
+
+    async def run(self):
+        start = runtime.time()
+        while True:
+            # the scenario turns every router off when its time is up, that is no event
+            now = runtime.time() - start
+            if now >= self.time_to_run:
+                break
+
+            self.__sample(round(now, 3))
+            await runtime.sleep(self.interval)
+
+        self.__reconvergence()
+
+    def result(self):
+        return {'routers': self.routers, 'sessions': self.sessions,
+                'first_established': self.first_established, 'all_established': self.all_established,
+                'converged': self.converged, 'events': self.events}
+
+
+# conf1 - conf9, a topology file, or kind:n generated by topology.generate() where the lowest AS goes off
+# after a third of the time
+def scenario_coroutine(name, time_to_run):
+    if name in SCENARIOS:
+        return getattr(examples, name)(time_to_run)
+
+    if name.endswith(('.json', '.yaml', '.yml')):
+        return Topology.load(name).run(time_to_run)
+
+    kind, n = name.split(':')
+    t = topology.generate(kind, int(n))
+    t.add_event(time_to_run // 3, min(t.routers), 'off')
+    return t.run(time_to_run)
+
+
+# runs one scenario in this process and returns its results
+def run_one(name, time_to_run, runtime_name='threads', codec='scapy', virtual=True):
+    tools.set_debug_level(0)
+    bgp.default_codec = codec
+    if runtime_name == 'asyncio':
+        runtime.use_asyncio(virtual=virtual)
+    elif virtual:
+        clock.set_virtual()
+
+    monitor = Monitor(time_to_run)
+
+    async def main():
+        th = runtime.start(monitor.run)
+        await scenario_coroutine(name, time_to_run)
+        await runtime.join(th)
+
+    wall = time.monotonic()
+    cpu = time.process_time()
+    runtime.run(main())
+    clock.leave()
+
+    result = {'scenario': name, 'time_to_run': time_to_run, 'runtime': runtime_name, 'codec': codec,
+              'virtual': virtual}
+    result.update(monitor.result())
+    result.update({'wall_s': round(time.monotonic() - wall, 3), 'cpu_s': round(time.process_time() - cpu, 3),
+                   'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+
+    return result
+
+
+# Memory of a BGP table holding prefixes /24 routes from each of peers, traced with tracemalloc.
+# Paths come from a pool of distinct_paths, as in a full table where many prefixes share a path,
+# every route gets a path tuple of its own as decoded updates do.
+def route_memory(prefixes=100000, peers=4, distinct_paths=10000, seed=0):
+    rng = random.Random(seed)
+    paths = [tuple(rng.randrange(1, 65000) for _ in range(rng.randrange(1, 6))) for _ in range(distinct_paths)]
+    networks = [n << 8 for n in rng.sample(range(1 << 24), prefixes)]
+    choices = [rng.randrange(distinct_paths) for _ in range(prefixes)]
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    table = BGPTable()
+    for peer in range(peers):
+        source = 64500 + peer
+        next_hop = tools.ip_to_int('172.16.0.%d' % (peer + 1))
+        for i, network in enumerate(networks):
+            path = (source,) + paths[(choices[i] + peer) % distinct_paths]
+            table.add(BGPRoute.from_ints(network, 0xffffff00, next_hop, path, source))
+
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    routes = prefixes * peers
+    attribute_sets, as_paths = interned()
+    return {'routes': routes, 'bytes': used, 'bytes_per_route': round(used / routes, 1),
+            'attribute_sets': attribute_sets, 'as_paths': as_paths}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# every scenario runs in its own process, so peak RSS and CPU time belong to that scenario alone
+def run_all(names, time_to_run, runtime_name, codec, virtual, timeout=None):
+    results = []
+    for name in names:
+        cmd = [sys.executable, __file__, '--child', '-s', name, '-t', str(time_to_run), '-r', runtime_name,
+               '-c', codec]
+        if not virtual:
+            cmd.append('--real')
+
+        try:
+            p = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+            lines = p.stdout.strip().splitlines()
+            result = json.loads(lines[-1]) if p.returncode == 0 and lines else {
+                'scenario': name, 'error': p.stderr.strip().splitlines()[-1:] or p.returncode}
+        except subprocess.TimeoutExpired:
+            result = {'scenario': name, 'error': f'timeout after {timeout} s'}
+
+        print(json.dumps(result), file=sys.stderr)
+        results.append(result)
+
+    return {'commit': git_commit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'results': results}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Convergence benchmarks. Scenarios are conf1 - conf9 from "
+                                                 "examples.py, topology files and generated topologies as kind:N, "
+                                                 "kind one of " + ", ".join(topology.GENERATORS) + ".")
+    parser.add_argument("-s", type=str, nargs='+', default=SCENARIOS + SYNTHETIC, help="Scenarios to run")
+    parser.add_argument("-t", type=int, default=180, help="Seconds every scenario runs for")
+    parser.add_argument("-r", type=str, default='threads', choices=['threads', 'asyncio'], help="Runtime")
+    parser.add_argument("-c", type=str, default='native', choices=['scapy', 'native'], help="BGP codec")
+    parser.add_argument("-o", type=str, default=None, help="Write the results to this JSON file")
+    parser.add_argument("--timeout", type=float, default=None, help="Wall clock seconds one scenario may take")
+    parser.add_argument("--real", action='store_true', help="Run on the real clock instead of the virtual one")
+    parser.add_argument("--memory", type=int, default=None, metavar='PREFIXES',
+                        help="Measure the memory of a BGP table of this many prefixes from 4 peers instead")
+    parser.add_argument("--child", action='store_true', help=argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+
+    if args.memory:
+        print(json.dumps(route_memory(args.memory)))
+    elif args.child:
+        print(json.dumps(run_one(args.s[0], args.t, args.r, args.c, not args.real)))
+    else:
+        report = run_all(args.s, args.t, args.r, args.c, not args.real, args.timeout)
+        if args.o:
+            with open(args.o, 'w') as f:
+                json.dump(report, f, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
@@ -1,332 +1,431 @@
 from sock import Sock
-from time import sleep
 import threading
-from random import randint
 from scapy.contrib.bgp import BGPHeader, BGPOpen, BGPUpdate, BGPPathAttr, BGPNLRI_IPv4, BGPPALocalPref, BGPKeepAlive, \
-    BGPPANextHop, BGPPAAS4BytesPath, BGPPAASPath
+    BGPPANextHop, BGPPAAS4BytesPath, BGPPAASPath, BGPNotification, bgp_module_conf
 
-from tools import int_to_ip, netmask_to_bits, craft_bgp_update, ip_to_int, cidr_to_netmask, debug_message
-from scapy.layers.inet import IP, ICMP, Ether
+from tools import craft_bgp_updates, craft_bgp_withdraws, ip_to_int, prefix_to_nlri, nlri_to_prefixes, debug_message, \
+    debug_enabled
+from scapy.layers.inet import IP, ICMP, Ether, TCP
+
+import bgpcodec
+import mrt
+import runtime
+from stats import Counters
+
+
+# codec used by BGP instances created without one: 'scapy' builds messages from scapy layers,
+# 'native' packs them to bytes with bgpcodec. Both put the same bytes on the wire and can talk to each other.
+default_codec = 'scapy'
+
+
+# paths are always sent with 4 byte AS numbers, the scapy codec must dissect received bytes the same way
+def setup_scapy_codec():
+    bgp_module_conf.use_2_bytes_asn = False
 
 
 class BGP:
-    def __init__(self, my_as, neighbour_as, my_ip, neighbour_ip):
+    def __init__(self, my_as, neighbour_as, my_ip, neighbour_ip, codec=None):
         self.__neighbour_keepalive = 0
         self.__th_main = None
 
         self.__working_socket = None
-        self.__server_socket = None
-        self.__client_socket = None
 
         self.__router = None
 
         self.__container = []
-        self.__data_lock = threading.Lock()
+        self.__data_lock = threading.Condition(threading.Lock())
 
         self.__shared_routes = {}
 
+        self.counters = Counters('bgp', ['updates_sent', 'prefixes_announced', 'prefixes_withdrawn',
+                                         'updates_received', 'prefixes_received', 'withdrawals_received',
+                                         'keepalives_sent', 'keepalives_received', 'state_transitions'],
+                                 {'send_queue': lambda: len(self.__container),
+                                  'established': lambda: int(self.state == 'ESTABLISHED')},
+                                 session=f"{my_as}-{neighbour_as}", neighbour=neighbour_ip)
+        self.__state = 'IDLE'
+
         self.my_as = my_as
         self.neighbour_as = neighbour_as
         self.my_ip = my_ip
         self.neighbour_ip = neighbour_ip
-        # IDLE, CONNECT, ACTIVE, OPEN SENT, OPEN CONFIRM, ESTABLISHED, ERROR
-        self.state = 'IDLE'
         self.error_code = 0
         self.hold_time = 30
+        # incremented every time the session gets ESTABLISHED
+        self.session_count = 0
         self.__keepalive_period = 3
-
-    def __listen_thread(self, s):
-        conn, addr = s.accept()
-        self.__server_socket = conn
-
-    def __receive_thread(self):
+        # seconds one TCP connection attempt may take
+        self.connect_timeout = 5
+        self.codec = codec or default_codec
+        if self.codec == 'scapy':
+            setup_scapy_codec()
+
+        self.__debug_source = f"BGP AS {my_as}, IP {my_ip}, Neighbour {neighbour_as}"
+        # the session key, and the router name once installed, see tools.set_debug_level()
+        self.__debug_key = (f"{my_as}-{neighbour_as}",)
+
+    # IDLE, CONNECT, ACTIVE, OPEN SENT, OPEN CONFIRM, ESTABLISHED, ERROR
+    @property
+    def state(self):
+        return self.__state
+
+    @state.setter
+    def state(self, state):
+        if state != self.__state:
+            self.__state = state
+            self.counters['state_transitions'] += 1
+
+    async def __receive_thread(self):
         while self.state == 'ESTABLISHED':
-            if self.__working_socket and self.__working_socket.state == 'ESTABLISHED':
-                data = self.__working_socket.recv()
-                if data:
-                    if data.haslayer(BGPKeepAlive):
-                        debug_message(4, f"BGP AS {self.my_as}, IP {self.my_ip},    Neighbour {self.neighbour_as}",
-                                      "receive_thread",
-                                      f"Received KEEPALIVE from AS {self.neighbour_as} {self.neighbour_ip} after {self.__neighbour_keepalive} sec.")
+            s = self.__working_socket
+            if not s or s.state != 'ESTABLISHED':
+                # the connection is gone, the main thread notices it through the hold timer
+                await runtime.sleep(0.1)
+                continue
+
+            # wakes up at least once a second to notice the session going down
+            data = await s.recv(timeout=1)
+            if data:
+                recorder = mrt.default_recorder
+                if recorder:
+                    recorder.write(runtime.time(), self.neighbour_as, self.my_as, self.neighbour_ip, self.my_ip,
+                                   bytes(data))
+
+                for msg in self.__decode(data):
+                    if isinstance(msg, bgpcodec.KeepAlive):
+                        self.counters['keepalives_received'] += 1
+                        if self.__debugging(4):
+                            self.__debug(4, "receive_thread", "Received KEEPALIVE from AS %s %s after %s sec.",
+                                         self.neighbour_as, self.neighbour_ip, self.__neighbour_keepalive)
                         self.__neighbour_keepalive = 0
-                    elif data.haslayer(BGPUpdate):
-                        up_layer = data.getlayer(BGPUpdate)
-                        n_routes_withdrawn = 0
-                        if up_layer.withdrawn_routes:
-                            n_routes_withdrawn = len(up_layer.withdrawn_routes)
-                            for i in range(len(up_layer.withdrawn_routes)):
-                                nlri = up_layer.withdrawn_routes[i].prefix
-                                network = nlri.split('/')[0]
-                                mask = cidr_to_netmask(nlri.split('/')[1])
+                    elif isinstance(msg, bgpcodec.Update):
+                        self.counters['updates_received'] += 1
+                        self.counters['prefixes_received'] += len(msg.nlri)
+                        self.counters['withdrawals_received'] += len(msg.withdrawn)
+                        if msg.withdrawn:
+                            self.__router.receive_withdraw_routes(msg.withdrawn, self.neighbour_as)
+
+                            if self.__debugging(3):
+                                self.__debug(3, "receive_thread", "Received UPDATE WITHDRAW from AS %s %s. Withdrawn: %s",
+                                             self.neighbour_as, self.neighbour_ip, len(msg.withdrawn))
+
+                        if msg.nlri and msg.as_path:
+                            if self.__debugging(3):
+                                self.__debug(3, "receive_thread", "Received UPDATE from AS %s %s. Announced: %s",
+                                             self.neighbour_as, self.neighbour_ip, len(msg.nlri))
+
+                            self.__router.add_bgp_routes(msg.nlri, msg.next_hop, msg.as_path, source=self.neighbour_as)
+
+    # received data (the raw TCP payload) as bgpcodec messages, whichever codec the neighbour encodes with
+    def __decode(self, data):
+        if self.codec == 'native':
+            return list(bgpcodec.decode(data))
+
+        data = BGPHeader(data)
+
+        if data.haslayer(BGPKeepAlive):
+            return [bgpcodec.KeepAlive()]
+
+        if data.haslayer(BGPOpen):
+            op = data.getlayer(BGPOpen)
+            return [bgpcodec.Open(op.my_as, op.hold_time, op.bgp_id, op.version)]
+
+        if data.haslayer(BGPNotification):
+            n = data.getlayer(BGPNotification)
+            return [bgpcodec.Notification(n.error_code, n.error_subcode, n.data or b'')]
 
-                                self.__router.receive_withdraw_route(ip_to_int(network), ip_to_int(mask), self.neighbour_as)
+        if data.haslayer(BGPUpdate):
+            up_layer = data.getlayer(BGPUpdate)
+            update = bgpcodec.Update()
 
-                            debug_message(3, f"BGP AS {self.my_as}, IP {self.my_ip},    Neighbour {self.neighbour_as}",
-                                          "receive_thread",
-                                          f"Received UPDATE WITHDRAW from AS {self.neighbour_as} {self.neighbour_ip}. Withdrawn: {n_routes_withdrawn}")
+            update.withdrawn = nlri_to_prefixes([w.prefix for w in up_layer.withdrawn_routes])
 
-                        if up_layer.path_attr and len(up_layer.path_attr):
-                            debug_message(3, f"BGP AS {self.my_as}, IP {self.my_ip}, Neighbour {self.neighbour_as}",
-                                          "receive_thread",
-                                          f"Received UPDATE from AS {self.neighbour_as} {self.neighbour_ip}.")
+            if up_layer.path_attr and up_layer.haslayer(BGPPAAS4BytesPath):
+                for s in up_layer.getlayer(BGPPAAS4BytesPath).segments:
+                    update.as_path.extend(s.segment_value)
 
-                            nlri = up_layer.nlri[0].prefix
-                            network = nlri.split('/')[0]
-                            mask = cidr_to_netmask(nlri.split('/')[1])
-                            as_path = []
+                update.next_hop = ip_to_int(up_layer.getlayer(BGPPANextHop).next_hop)
 
-                            if up_layer.haslayer(BGPPAAS4BytesPath):
-                                segments = up_layer.getlayer(BGPPAAS4BytesPath).segments
+                update.nlri = nlri_to_prefixes([n.prefix for n in up_layer.nlri])
 
-                                for s in segments:
-                                    as_path.append(s.segment_value[0])
+            return [update]
 
-                                h = up_layer.getlayer(BGPPANextHop)
-                                next_hop = h.next_hop
+        return []
 
-                                self.__router.add_bgp_route(network, mask, next_hop, as_path, source=self.neighbour_as)
-            sleep(0.001)
+    def __craft_open(self):
+        if self.codec == 'native':
+            return bgpcodec.encode_open(self.my_as, self.hold_time, self.my_ip)
 
-    def __handshake(self):
-        server_socket = Sock(self.__router)
-        server_socket.bind((self.my_ip, 179))
-        if server_socket.listen():
-            th_listen = threading.Thread(target=self.__listen_thread, args=(server_socket,))
-            th_listen.start()
+        hdr = BGPHeader(type=1, marker=0xffffffffffffffffffffffffffffffff)
+        return hdr / BGPOpen(my_as=self.my_as, hold_time=self.hold_time, bgp_id=self.my_ip)
 
-            sleep_time = randint(0, 12) * 10
-            while not self.__server_socket and sleep_time != 0:
-                sleep_time -= 1
-                sleep(0.1)
+    def __craft_keepalive(self):
+        if self.codec == 'native':
+            return bgpcodec.encode_keepalive()
 
-            if self.__server_socket:
-                return 0, self.__server_socket
+        return BGPKeepAlive()
 
-        server_socket.close()
+    # the side with the lower address listens and the other one connects, so the handshake completes as soon as
+    # both are up instead of the two sides guessing who should listen
+    async def __handshake(self):
+        if ip_to_int(self.my_ip) < ip_to_int(self.neighbour_ip):
+            server_socket = Sock(self.__router)
+            server_socket.bind((self.my_ip, 179))
+            if server_socket.listen():
+                conn, addr = await server_socket.accept(self.connect_timeout)
+                if conn:
+                    return 0, conn
+
+            server_socket.close()
+            self.__debug(4, "handshake", "No TCP connection from the neighbour within timeout. %s -> %s:179",
+                         self.neighbour_ip, self.my_ip)
+            return None, None
 
         client_socket = Sock(self.__router)
         client_socket.bind((self.my_ip, 0))
 
-        if client_socket.connect((self.neighbour_ip, 179)):
+        if await client_socket.connect((self.neighbour_ip, 179), self.connect_timeout):
             return 1, client_socket
         else:
-            debug_message(4, f"BGP AS {self.my_as}, IP {self.my_ip},    Neighbour {self.neighbour_as}", "handshake",
-                          f"TCP connection exceeded timeout. {self.my_ip}:random_free -> {self.neighbour_ip}:179")
+            self.__debug(4, "handshake", "TCP connection exceeded timeout. %s:random_free -> %s:179",
+                         self.my_ip, self.neighbour_ip)
 
             client_socket.close()
             return None, None
 
-    def __main_thread(self):
+    async def __main_thread(self):
         self.state = 'CONNECT'
         client = 0
 
         # establish TCP connection
         connect_tries = 0
-        debug_message(4, f"BGP AS {self.my_as}, IP {self.my_ip},    Neighbour {self.neighbour_as}", "main_thread",
-                      f"Initialising TCP connection.")
+        self.__debug(4, "main_thread", "Initialising TCP connection.")
         while self.state != 'ACTIVE' and self.state != 'IDLE':
-            shake = self.__handshake()
+            shake = await self.__handshake()
             if shake[1]:
                 self.state = 'ACTIVE'
                 client = shake[0]
                 self.__working_socket = shake[1]
-                debug_message(4, f"BGP AS {self.my_as}, IP {self.my_ip},    Neighbour {self.neighbour_as}", "main_thread",
-                              f"TCP connection initialised. {self.__working_socket.src_ip}:{self.__working_socket.sport} -> {self.__working_socket.dst_ip}:{self.__working_socket.dport}")
+                s = self.__working_socket
+                self.__debug(4, "main_thread", "TCP connection initialised. %s:%s -> %s:%s",
+                             s.src_ip, s.sport, s.dst_ip, s.dport)
                 break
 
             connect_tries += 1
             if connect_tries > 3:
                 self.state = 'ERROR'
                 self.error_code = 5
-                debug_message(2, f"BGP AS {self.my_as}, IP {self.my_ip},    Neighbour {self.neighbour_as}", "main_thread",
-                              f"Error 5. Unable to establish TCP connection after {connect_tries} tries.")
+                self.__debug(2, "main_thread", "Error 5. Unable to establish TCP connection after %s tries.",
+                             connect_tries)
                 connect_tries = 0
                 break
         # establish BGP connection
         if self.state == 'ACTIVE':
-            debug_message(4, f"BGP AS {self.my_as}, IP {self.my_ip},    Neighbour {self.neighbour_as}", "main_thread",
-                          f"Initialising BGP conversation.")
-            hdr = BGPHeader(type=1, marker=0xffffffffffffffffffffffffffffffff)
-            op = BGPOpen(my_as=self.my_as, hold_time=self.hold_time, bgp_id=self.my_ip)
-
+            self.__debug(4, "main_thread", "Initialising BGP conversation.")
             # we are the client, send BGP Open
             if client:
-                bgp = hdr / op
-                self.__working_socket.sendall(bgp)
+                self.__working_socket.sendall(self.__craft_open())
                 self.state = 'OPEN SENT'
 
-            data = self.__working_socket.recv()
+            # the neighbour has to open the conversation within the hold time
+            data = await self.__working_socket.recv(timeout=self.hold_time)
+            messages = self.__decode(data) if data else []
 
-            if data and data.haslayer(BGPHeader) and data.haslayer(BGPOpen):
-                rbgp = data.getlayer('OPEN')
+            if messages and isinstance(messages[0], bgpcodec.Open):
+                rbgp = messages[0]
                 if self.neighbour_as == rbgp.my_as and self.neighbour_ip == rbgp.bgp_id:
                     if self.state == 'OPEN SENT':
                         if self.hold_time > rbgp.hold_time:
                             self.hold_time = rbgp.hold_time
 
                         self.state = 'OPEN CONFIRM'
-                        sleep(0.01)
+                        await runtime.sleep(0.01)
                         self.state = 'ESTABLISHED'
 
                     elif self.state == 'ACTIVE':
                         if self.hold_time > rbgp.hold_time:
                             self.hold_time = rbgp.hold_time
 
-                        op = BGPOpen(my_as=self.my_as, hold_time=self.hold_time, bgp_id=self.my_ip)
-                        bgp_answer = hdr / op
-                        self.__working_socket.sendall(bgp_answer)
+                        self.__working_socket.sendall(self.__craft_open())
                         self.state = 'ESTABLISHED'
                 else:
                     self.state = 'ERROR'
                     self.error_code = 2
-                    debug_message(2, f"BGP AS {self.my_as}, IP {self.my_ip},    Neighbour {self.neighbour_as}",
-                                  "main_thread",
-                                  f"Error 2. Incorrect neighbour AS received.")
+                    self.__debug(2, "main_thread", "Error 2. Incorrect neighbour AS received.")
                     # send NOTIFICATION message
             else:
                 self.state = 'ERROR'
                 self.error_code = 1
-                debug_message(2, f"BGP AS {self.my_as}, IP {self.my_ip},    Neighbour {self.neighbour_as}",
-                              "main_thread",
-                              f"Error 1. Error receiving data. {data}")
+                self.__debug(2, "main_thread", "Error 1. Error receiving data. %s", data)
 
         th_receive = None
 
         if self.state == 'ESTABLISHED':
-            debug_message(4, f"BGP AS {self.my_as}, IP {self.my_ip},    Neighbour {self.neighbour_as}", "main_thread",
-                          f"BGP conversation established.")
+            self.session_count += 1
+            self.__debug(4, "main_thread", "BGP conversation established.")
             # start recv threat
-            th_receive = threading.Thread(target=self.__receive_thread)
-            th_receive.start()
+            th_receive = runtime.start(self.__receive_thread)
 
             keepalive_timer = self.hold_time / self.__keepalive_period
             self.__neighbour_keepalive = 0
+            next_tick = runtime.time()
 
             while self.state == 'ESTABLISHED':
-                if self.hold_time > 0:
-                    if keepalive_timer >= self.hold_time / self.__keepalive_period:
-                        kpa = BGPKeepAlive()
-                        self.__working_socket.sendall(kpa)
+                if runtime.time() >= next_tick:
+                    next_tick += 1
 
-                        debug_message(4, f"BGP AS {self.my_as}, IP {self.my_ip}, Neighbour {self.neighbour_as}",
-                                      "main_thread",
-                                      f"Keepalive sent to neighbour after {keepalive_timer} sec.")
+                    if self.hold_time > 0:
+                        if keepalive_timer >= self.hold_time / self.__keepalive_period:
+                            self.__working_socket.sendall(self.__craft_keepalive())
+                            self.counters['keepalives_sent'] += 1
 
-                        keepalive_timer = 0
+                            self.__debug(4, "main_thread", "Keepalive sent to neighbour after %s sec.", keepalive_timer)
 
-                    if self.__neighbour_keepalive > self.hold_time:
-                        self.state = 'ERROR'
-                        self.error_code = 4
-                        debug_message(2, f"BGP AS {self.my_as}, IP {self.my_ip}, Neighbour {self.neighbour_as}",
-                                      "main_thread",
-                                      f"Error 4. No keepalive from the neighbour after {self.__neighbour_keepalive} sec.")
+                            keepalive_timer = 0
 
-                    keepalive_timer += 1
-                    self.__neighbour_keepalive += 1
+                        if self.__neighbour_keepalive > self.hold_time:
+                            self.state = 'ERROR'
+                            self.error_code = 4
+                            self.__debug(2, "main_thread", "Error 4. No keepalive from the neighbour after %s sec.",
+                                         self.__neighbour_keepalive)
 
+                        keepalive_timer += 1
+                        self.__neighbour_keepalive += 1
+
+                # queued updates go out as soon as they are added, timers are checked once a second
                 with self.__data_lock:
                     while len(self.__container) > 0:
                         data = self.__container.pop(0)
                         self.__working_socket.sendall(data)
 
-                sleep(1)
+                    if self.state == 'ESTABLISHED':
+                        await runtime.wait(self.__data_lock, max(next_tick - runtime.time(), 0))
         else:
             self.state = 'ERROR'
             self.error_code = 3
-            debug_message(2, f"BGP AS {self.my_as}, IP {self.my_ip}, Neighbour {self.neighbour_as}",
-                          "main_thread",
-                          f"Error 3. Unable to initialise BGP conversation.")
+            self.__debug(2, "main_thread", "Error 3. Unable to initialise BGP conversation.")
 
         if self.__working_socket:
             self.__working_socket.close()
 
         if th_receive:
-            th_receive.join()
+            await runtime.join(th_receive)
 
     def install(self, r):
         self.__router = r
+        self.__debug_key = (r.name, f"{self.my_as}-{self.neighbour_as}")
+        self.counters.labels['router'] = r.name
+
+    # message is a format string for args or a callable, nothing is formatted when the level is disabled
+    def __debug(self, severity, procedure, message, *args):
+        debug_message(severity, self.__debug_source, procedure, message, *args, key=self.__debug_key)
+
+    # guards debug calls made for every received message
+    def __debugging(self, severity):
+        return debug_enabled(severity, self.__debug_key)
+
+    def __queue(self, bgp_updates):
+        with self.__data_lock:
+            self.__container.extend(bgp_updates)
+            runtime.notify_all(self.__data_lock)
+
+    # packs prefixes sharing the same path into as few UPDATE messages as possible,
+    # prefixes are (network, mask) pairs
+    def __announce(self, announced, withdrawn):
+        bgp_updates = []
+
+        if self.codec == 'native':
+            if withdrawn:
+                bgp_updates += bgpcodec.encode_withdraws(withdrawn)
+
+            next_hop = ip_to_int(self.my_ip)
+            for as_path, prefixes in announced.items():
+                bgp_updates += bgpcodec.encode_updates(as_path, next_hop, prefixes)
+        else:
+            hdr = BGPHeader(type=2, marker=0xffffffffffffffffffffffffffffffff)
 
+            if withdrawn:
+                bgp_updates += [hdr / u for u in craft_bgp_withdraws([prefix_to_nlri(p) for p in withdrawn])]
+
+            for as_path, prefixes in announced.items():
+                nlris = [prefix_to_nlri(p) for p in prefixes]
+                bgp_updates += [hdr / u for u in craft_bgp_updates('IGP', list(as_path), self.my_ip, nlris)]
+
+        if bgp_updates:
+            self.counters['updates_sent'] += len(bgp_updates)
+            self.counters['prefixes_announced'] += sum(map(len, announced.values()))
+            self.counters['prefixes_withdrawn'] += len(withdrawn)
+            self.__queue(bgp_updates)
+
+    # __shared_routes keeps the path announced to the neighbour for every (network, mask),
+    # a prefix is only sent again when its path changes
     def add_internal_routes(self, routes):
-        hdr = BGPHeader(type=2, marker=0xffffffffffffffffffffffffffffffff)
+        announced = {}
 
         for r in routes:
-            network = int_to_ip(r[0])
-            mask = str(netmask_to_bits(int_to_ip(r[1])))
-            nlri = network + '/' + mask
+            prefix = (r[0], r[1])
             as_path = [self.my_as]
-            key = nlri + "_" + ' '.join(map(str, as_path))
 
-            if key not in self.__shared_routes:
-                self.__shared_routes[key] = (nlri, as_path)
-                bgp_update = hdr / craft_bgp_update('IGP', as_path, self.my_ip, nlri)
-                with self.__data_lock:
-                    self.__container.append(bgp_update)
+            if self.__shared_routes.get(prefix) != as_path:
+                self.__shared_routes[prefix] = as_path
+                announced.setdefault(tuple(as_path), []).append(prefix)
+
+        self.__announce(announced, [])
 
     def withdraw_route(self, r):
-        hdr = BGPHeader(type=2, marker=0xffffffffffffffffffffffffffffffff)
-
-        network = int_to_ip(r.network)
-        mask = netmask_to_bits(int_to_ip(r.mask))
-        nlri = network + '/' + str(mask)
-        as_path = [self.my_as] + r.path
-        key = nlri + "_" + ' '.join(map(str, as_path))
-        if key in self.__shared_routes:
-            # self.1shared_routes[key] = (nlri, as_path)
-            bgp_update = hdr / BGPUpdate(withdrawn_routes_len=None, withdrawn_routes=[BGPNLRI_IPv4(prefix=nlri)])
-            with self.__data_lock:
-                self.__container.append(bgp_update)
+        self.withdraw_routes([r])
+
+    def withdraw_routes(self, routes):
+        withdrawn = []
+
+        for r in routes:
+            prefix = (r.network, r.mask)
+            as_path = [self.my_as, *r.path]
+
+            if self.__shared_routes.get(prefix) == as_path:
+                del self.__shared_routes[prefix]
+                withdrawn.append(prefix)
+
+        self.__announce({}, withdrawn)
 
     def add_shared_routes(self, routes):
-        hdr = BGPHeader(type=2, marker=0xffffffffffffffffffffffffffffffff)
+        announced = {}
+        withdrawn = []
 
         for r in routes:
-            n = int_to_ip(r.network)
-            m = int_to_ip(r.mask)
-            if self.my_as in r.path:
-                continue
+            prefix = (r.network, r.mask)
 
-            if self.neighbour_as in r.path:
+            if not r.advertise or self.my_as in r.path or self.neighbour_as in r.path:
+                # the new path can not be announced here, the neighbour must not keep using the old one
+                if prefix in self.__shared_routes:
+                    del self.__shared_routes[prefix]
+                    withdrawn.append(prefix)
                 continue
 
-            network = int_to_ip(r.network)
-            mask = netmask_to_bits(int_to_ip(r.mask))
-            nlri = network + '/' + str(mask)
-            as_path = [self.my_as] + r.path
-            key = nlri + "_" + ' '.join(map(str, as_path))
-            if key not in self.__shared_routes:
-                self.__shared_routes[key] = (nlri, as_path)
-                bgp_update = hdr / craft_bgp_update('IGP', as_path, self.my_ip, nlri)
-                with self.__data_lock:
-                    self.__container.append(bgp_update)
+            as_path = [self.my_as, *r.path]
+            if self.__shared_routes.get(prefix) != as_path:
+                self.__shared_routes[prefix] = as_path
+                announced.setdefault(tuple(as_path), []).append(prefix)
+
+        self.__announce(announced, withdrawn)
 
     def on(self):
-        debug_message(5, f"BGP AS {self.my_as}, IP {self.my_ip}, Neighbour {self.neighbour_as}",
-                      "on",
-                      f"Starting...")
-        self.__th_main = threading.Thread(target=self.__main_thread)
-        self.__th_main.start()
-        debug_message(5, f"BGP AS {self.my_as}, IP {self.my_ip}, Neighbour {self.neighbour_as}",
-                      "on",
-                      f"BGP instance started.")
-
-    def off(self):
-        debug_message(5, f"BGP AS {self.my_as}, IP {self.my_ip}, Neighbour {self.neighbour_as}",
-                      "off",
-                      f"Shutting down...")
+        self.__debug(5, "on", "Starting...")
+        self.__th_main = runtime.start(self.__main_thread)
+        self.__debug(5, "on", "BGP instance started.")
+
+    async def off(self):
+        self.__debug(5, "off", "Shutting down...")
 
         self.state = 'IDLE'
-        sleep(1)
+        await runtime.sleep(1)
         self.state = 'IDLE'
 
-        self.__th_main.join()
+        await runtime.join(self.__th_main)
 
-        debug_message(5, f"BGP AS {self.my_as}, IP {self.my_ip}, Neighbour {self.neighbour_as}",
-                      "off",
-                      f"Shut down.")
+        self.__debug(5, "off", "Shut down.")
 
         self.__working_socket = None
-        self.__client_socket = None
-        self.__server_socket = None
         self.__shared_routes = {}
 
 
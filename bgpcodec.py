@@ -0,0 +1,230 @@
+import socket
+import struct
+
+# Encodes and decodes BGP messages straight to and from bytes.
+# The layout matches what the scapy layers in tools.craft_bgp_update produce: ORIGIN, AS_PATH with 4 byte AS numbers
+# and one AS_SEQUENCE segment per AS, NEXT_HOP, MULTI_EXIT_DISC, LOCAL_PREF, so captures dissect the same.
+# Prefixes are (network, mask) integer pairs as used by Route and BGPRoute.
+
+MARKER = b'\xff' * 16
+HEADER = struct.Struct('!16sHB')
+OPEN = struct.Struct('!BHH4sB')
+NOTIFICATION = struct.Struct('!BB')
+HEADER_LEN = HEADER.size
+MAX_MESSAGE_LEN = 4096
+
+TYPE_OPEN = 1
+TYPE_UPDATE = 2
+TYPE_NOTIFICATION = 3
+TYPE_KEEPALIVE = 4
+
+ATTR_ORIGIN = 1
+ATTR_AS_PATH = 2
+ATTR_NEXT_HOP = 3
+ATTR_MULTI_EXIT_DISC = 4
+ATTR_LOCAL_PREF = 5
+
+FLAG_OPTIONAL = 0x80
+FLAG_TRANSITIVE = 0x40
+FLAG_EXTENDED_LENGTH = 0x10
+
+ORIGIN_IGP = 0
+AS_SEQUENCE = 2
+
+PREFIX_LENGTHS = {(0xffffffff << (32 - i)) & 0xffffffff: i for i in range(33)}
+PREFIX_MASKS = [(0xffffffff << (32 - i)) & 0xffffffff for i in range(33)]
+
+
+class Open:
+    def __init__(self, my_as, hold_time, bgp_id, version=4):
+        self.my_as = my_as
+        self.hold_time = hold_time
+        self.bgp_id = bgp_id
+        self.version = version
+
+
+class Update:
+    def __init__(self, withdrawn=None, nlri=None, as_path=None, next_hop=0, origin=ORIGIN_IGP, med=0, local_pref=100):
+        self.withdrawn = withdrawn or []
+        self.nlri = nlri or []
+        self.as_path = as_path or []
+        self.next_hop = next_hop
+        self.origin = origin
+        self.med = med
+        self.local_pref = local_pref
+
+
+class Notification:
+    def __init__(self, error_code, error_subcode, data=b''):
+        self.error_code = error_code
+        self.error_subcode = error_subcode
+        self.data = data
+
+
+class KeepAlive:
+    pass
+
+
+def prefix_len(prefix):
+    return 1 + (PREFIX_LENGTHS[prefix[1]] + 7) // 8
+
+
+def encode_prefix(network, mask):
+    bits = PREFIX_LENGTHS[mask]
+    return bytes((bits,)) + network.to_bytes(4, 'big')[:(bits + 7) // 8]
+
+
+def encode_message(msg_type, body=b''):
+    return HEADER.pack(MARKER, HEADER_LEN + len(body), msg_type) + body
+
+
+def encode_open(my_as, hold_time, bgp_id):
+    return encode_message(TYPE_OPEN, OPEN.pack(4, my_as, hold_time, socket.inet_aton(bgp_id), 0))
+
+
+def encode_keepalive():
+    return encode_message(TYPE_KEEPALIVE)
+
+
+def encode_notification(error_code, error_subcode, data=b''):
+    return encode_message(TYPE_NOTIFICATION, NOTIFICATION.pack(error_code, error_subcode) + data)
+
+
+def encode_attribute(flags, code, value):
+    if len(value) > 255:
+        return struct.pack('!BBH', flags | FLAG_EXTENDED_LENGTH, code, len(value)) + value
+
+    return struct.pack('!BBB', flags, code, len(value)) + value
+
+
+def encode_path_attributes(as_path, next_hop, origin=ORIGIN_IGP, med=0, local_pref=100):
+    segments = b''.join(struct.pack('!BBI', AS_SEQUENCE, 1, a) for a in as_path)
+
+    return (encode_attribute(FLAG_TRANSITIVE, ATTR_ORIGIN, bytes((origin,))) +
+            encode_attribute(FLAG_TRANSITIVE, ATTR_AS_PATH, segments) +
+            encode_attribute(FLAG_TRANSITIVE, ATTR_NEXT_HOP, next_hop.to_bytes(4, 'big')) +
+            encode_attribute(FLAG_OPTIONAL, ATTR_MULTI_EXIT_DISC, med.to_bytes(4, 'big')) +
+            encode_attribute(FLAG_TRANSITIVE, ATTR_LOCAL_PREF, local_pref.to_bytes(4, 'big')))
+
+
+def encode_update(withdrawn=(), as_path=None, next_hop=0, nlri=(), path_attributes=None):
+    withdrawn = b''.join(encode_prefix(n, m) for n, m in withdrawn)
+
+    if path_attributes is None:
+        path_attributes = encode_path_attributes(as_path, next_hop) if nlri else b''
+
+    nlri = b''.join(encode_prefix(n, m) for n, m in nlri)
+
+    return encode_message(TYPE_UPDATE, struct.pack('!H', len(withdrawn)) + withdrawn +
+                          struct.pack('!H', len(path_attributes)) + path_attributes + nlri)
+
+
+def split_prefixes(prefixes, space):
+    chunk = []
+    used = 0
+    for prefix in prefixes:
+        size = prefix_len(prefix)
+        if chunk and used + size > space:
+            yield chunk
+            chunk = []
+            used = 0
+
+        chunk.append(prefix)
+        used += size
+
+    if chunk:
+        yield chunk
+
+
+# as few UPDATE messages as possible announcing prefixes with the same path
+def encode_updates(as_path, next_hop, prefixes):
+    path_attributes = encode_path_attributes(as_path, next_hop)
+    space = MAX_MESSAGE_LEN - HEADER_LEN - 4 - len(path_attributes)
+
+    return [encode_update(nlri=chunk, path_attributes=path_attributes) for chunk in split_prefixes(prefixes, space)]
+
+
+def encode_withdraws(prefixes):
+    space = MAX_MESSAGE_LEN - HEADER_LEN - 4
+
+    return [encode_update(withdrawn=chunk) for chunk in split_prefixes(prefixes, space)]
+
+
+def decode_prefixes(data, offset, end):
+    prefixes = []
+    while offset < end:
+        bits = data[offset]
+        size = (bits + 7) // 8
+        network = int.from_bytes(bytes(data[offset + 1:offset + 1 + size]) + b'\x00' * (4 - size), 'big')
+        prefixes.append((network & PREFIX_MASKS[bits], PREFIX_MASKS[bits]))
+        offset += 1 + size
+
+    return prefixes
+
+
+def decode_update(body):
+    update = Update()
+
+    withdrawn_len, = struct.unpack_from('!H', body, 0)
+    update.withdrawn = decode_prefixes(body, 2, 2 + withdrawn_len)
+
+    offset = 2 + withdrawn_len
+    attr_len, = struct.unpack_from('!H', body, offset)
+    offset += 2
+    end = offset + attr_len
+
+    while offset < end:
+        flags, code = body[offset], body[offset + 1]
+        if flags & FLAG_EXTENDED_LENGTH:
+            length, = struct.unpack_from('!H', body, offset + 2)
+            offset += 4
+        else:
+            length = body[offset + 2]
+            offset += 3
+
+        value = body[offset:offset + length]
+        offset += length
+
+        if code == ATTR_ORIGIN:
+            update.origin = value[0]
+        elif code == ATTR_AS_PATH:
+            i = 0
+            while i < length:
+                count = value[i + 1]
+                update.as_path.extend(struct.unpack_from('!%dI' % count, value, i + 2))
+                i += 2 + 4 * count
+        elif code == ATTR_NEXT_HOP:
+            update.next_hop = int.from_bytes(value, 'big')
+        elif code == ATTR_MULTI_EXIT_DISC:
+            update.med = int.from_bytes(value, 'big')
+        elif code == ATTR_LOCAL_PREF:
+            update.local_pref = int.from_bytes(value, 'big')
+
+    update.nlri = decode_prefixes(body, end, len(body))
+
+    return update
+
+
+# yields the messages found in data, which may hold several messages back to back
+def decode(data):
+    data = memoryview(data)
+    offset = 0
+
+    while offset + HEADER_LEN <= len(data):
+        marker, length, msg_type = HEADER.unpack_from(data, offset)
+        if length < HEADER_LEN:
+            break
+
+        body = data[offset + HEADER_LEN:offset + length]
+        offset += length
+
+        if msg_type == TYPE_UPDATE:
+            yield decode_update(body)
+        elif msg_type == TYPE_KEEPALIVE:
+            yield KeepAlive()
+        elif msg_type == TYPE_OPEN:
+            version, my_as, hold_time, bgp_id, opt_len = OPEN.unpack_from(body, 0)
+            yield Open(my_as, hold_time, socket.inet_ntoa(bgp_id), version)
+        elif msg_type == TYPE_NOTIFICATION:
+            error_code, error_subcode = NOTIFICATION.unpack_from(body, 0)
+            yield Notification(error_code, error_subcode, bytes(body[2:]))
@@ -1,19 +1,90 @@
+import weakref
+
 from tools import ip_to_int
 
 
+# Everything of a BGP route but its prefix and source. Routes with the same path and next hop share one
+# PathAttributes from attributes(), so a full table from several peers keeps every distinct path once.
+# Shared objects must never be changed, a route gets other attributes by being replaced.
+class PathAttributes:
+    __slots__ = ('path', 'next_hop', 'advertise', '__weakref__')
+
+    def __init__(self, path, next_hop, advertise=True):
+        self.path = path
+        self.next_hop = next_hop
+        # False for routes which must not be announced to the peers
+        self.advertise = advertise
+
+
+# (path, next_hop, advertise) -> PathAttributes and path -> a PathAttributes holding that path tuple,
+# entries go away with the last route using them
+_attributes = weakref.WeakValueDictionary()
+_paths = weakref.WeakValueDictionary()
+
+
+# the shared PathAttributes for path (a sequence of AS numbers) and next_hop (an int)
+def attributes(path, next_hop, advertise=True):
+    if type(path) is not tuple:
+        path = tuple(path)
+
+    key = (path, next_hop, advertise)
+    a = _attributes.get(key)
+    if a is None:
+        owner = _paths.get(path)
+        if owner is not None:
+            path = owner.path
+
+        a = PathAttributes(path, next_hop, advertise)
+        _attributes[key] = a
+        if owner is None:
+            _paths[path] = a
+
+    return a
+
+
+# number of distinct attribute sets and AS paths in use
+def interned():
+    return len(_attributes), len(_paths)
+
+
 class BGPRoute:
-    def __init__(self, network, mask, next_hop, path, weight=0, status=0, source=None):
+    __slots__ = ('network', 'mask', 'source', 'attributes')
+
+    def __init__(self, network, mask, next_hop, path, source=None, advertise=True):
         self.mask = ip_to_int(mask)
-        self.network = ip_to_int(network)
-        self.network &= self.mask
-        self.next_hop = ip_to_int(next_hop)
-        self.weight = int(weight)
+        self.network = ip_to_int(network) & self.mask
+
+        if isinstance(path, str):
+            path = [int(as_num) for as_num in path.split()]
+        self.attributes = attributes(path, ip_to_int(next_hop), advertise)
+
+        self.source = source or self.attributes.path[0]
+
+    @property
+    def path(self):
+        return self.attributes.path
+
+    @property
+    def next_hop(self):
+        return self.attributes.next_hop
+
+    @property
+    def advertise(self):
+        return self.attributes.advertise
 
-        self.path = []
-        for as_num in path.split():
-            self.path.append(int(as_num))
+    # route from a prefix as ints and attributes from attributes()
+    @classmethod
+    def from_attributes(cls, network, mask, attrs, source=None):
+        r = cls.__new__(cls)
+        r.mask = mask
+        # network & mask is a new int object, the one of the caller is shared when it is masked already
+        r.network = network if not network & ~mask else network & mask
+        r.attributes = attrs
+        r.source = source if source is not None else (attrs.path[0] if attrs.path else 0)
 
-        self.source = source
+        return r
 
-        if not self.source:
-            self.source = self.path[0]
+    # route from values which are already ints, path is a sequence of AS numbers
+    @classmethod
+    def from_ints(cls, network, mask, next_hop, path, source=None, advertise=True):
+        return cls.from_attributes(network, mask, attributes(path, next_hop, advertise), source)
@@ -0,0 +1,88 @@
+# BGP routes indexed by prefix, every prefix keeps at most one route per source AS.
+# The routes of a prefix are a tuple in the order their sources first announced it, a change builds a new tuple.
+# A tuple of a few routes is a third of the size of a dict, and since tuples are never changed, snapshot() is a
+# copy of the prefix index alone. The per source index lets a peer going down drop only its own routes,
+# it holds the routes themselves so it keeps no (network, mask) keys of its own.
+class BGPTable:
+    def __init__(self):
+        self.__prefixes = {}
+        self.__sources = {}
+        # kept by add() and remove(), so len() is one read which other threads may do without the lock
+        self.__count = 0
+
+    def __len__(self):
+        return self.__count
+
+    def __iter__(self):
+        for routes in self.__prefixes.values():
+            yield from routes
+
+    def prefixes(self):
+        return self.__prefixes.items()
+
+    # {(network, mask): (routes)} as it is now, the table can change while it is read
+    def snapshot(self):
+        return dict(self.__prefixes)
+
+    def get(self, network, mask):
+        return list(self.__prefixes.get((network, mask), ()))
+
+    def find(self, network, mask, source):
+        for r in self.__prefixes.get((network, mask), ()):
+            if r.source == source:
+                return r
+
+        return None
+
+    # returns the route of the same source which was replaced
+    def add(self, route):
+        key = (route.network, route.mask)
+        routes = self.__prefixes.get(key, ())
+
+        old = None
+        for i, r in enumerate(routes):
+            if r.source == route.source:
+                old = r
+                self.__prefixes[key] = routes[:i] + (route,) + routes[i + 1:]
+                break
+        else:
+            self.__prefixes[key] = routes + (route,)
+            self.__count += 1
+
+        source_routes = self.__sources.setdefault(route.source, set())
+        source_routes.discard(old)
+        source_routes.add(route)
+
+        return old
+
+    # drops r from the routes of its prefix
+    def __unlink(self, r):
+        key = (r.network, r.mask)
+        routes = tuple(other for other in self.__prefixes[key] if other is not r)
+        if routes:
+            self.__prefixes[key] = routes
+        else:
+            del self.__prefixes[key]
+
+        self.__count -= 1
+
+    def remove(self, network, mask, source):
+        r = self.find(network, mask, source)
+        if r is None:
+            return None
+
+        self.__unlink(r)
+
+        source_routes = self.__sources[source]
+        source_routes.discard(r)
+        if not source_routes:
+            del self.__sources[source]
+
+        return r
+
+    def remove_source(self, source):
+        removed = list(self.__sources.pop(source, ()))
+        for r in removed:
+            self.__unlink(r)
+
+        return removed
@@ -0,0 +1,117 @@
+import os
+import queue
+import threading
+import time
+
+from scapy.data import DLT_EN10MB
+from scapy.utils import PcapWriter
+
+from tools import debug_message
+
+
+# Writes frames to a pcap file from a background thread.
+# Wires only put frames into a bounded queue, frames are dropped (and counted) when the writer can not keep up.
+class Capture:
+    def __init__(self, filename, max_bytes=0, max_seconds=0, queue_size=10000, batch_size=256):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+
+        self.__queue = queue.Queue(queue_size)
+        self.__th_main = None
+        self.__writer = None
+        self.__file_index = 0
+        self.__file_opened = 0
+        self.state = 0
+
+    def __file_name(self):
+        if not self.__file_index:
+            return self.filename
+
+        root, ext = os.path.splitext(self.filename)
+        return f"{root}.{self.__file_index}{ext}"
+
+    def __open(self):
+        self.__writer = PcapWriter(self.__file_name(), linktype=DLT_EN10MB, append=False, sync=False)
+        self.__file_opened = time.monotonic()
+
+    def __rotate(self):
+        size_exceeded = self.max_bytes and self.__writer.f.tell() >= self.max_bytes
+        time_exceeded = self.max_seconds and time.monotonic() - self.__file_opened >= self.max_seconds
+        if not size_exceeded and not time_exceeded:
+            return
+
+        self.__writer.close()
+        self.__file_index += 1
+        self.__open()
+
+    def __main_thread(self):
+        self.__open()
+
+        while self.state or not self.__queue.empty():
+            try:
+                batch = [self.__queue.get(timeout=0.5)]
+            except queue.Empty:
+                self.__writer.flush()
+                continue
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self.__writer.write(batch)
+            self.written += len(batch)
+            self.__rotate()
+
+        self.__writer.close()
+        self.__writer = None
+
+    def write(self, frame):
+        try:
+            self.__queue.put_nowait(frame)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        if self.state:
+            return
+
+        self.state = 1
+        self.__th_main = threading.Thread(target=self.__main_thread, daemon=True)
+        self.__th_main.start()
+
+    def stop(self):
+        if not self.state:
+            return
+
+        self.state = 0
+        self.__th_main.join()
+        debug_message(4, "Capture", "stop", "Capture %s stopped. Written %s, dropped %s.",
+                      self.filename, self.written, self.dropped)
+
+
+# capture used by every wire which has no capture of its own, None disables capturing
+default_capture = None
+
+
+def start_capture(filename, **kwargs):
+    global default_capture
+
+    stop_capture()
+    default_capture = Capture(filename, **kwargs)
+    default_capture.start()
+
+    return default_capture
+
+
+def stop_capture():
+    global default_capture
+
+    if default_capture:
+        default_capture.stop()
+        default_capture = None
@@ -0,0 +1,200 @@
+import heapq
+import threading
+import time as _time
+
+
+class _Waiter:
+    __slots__ = ('lock', 'fired', 'notified')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.lock.acquire()
+        self.fired = False
+        self.notified = False
+
+
+# Time source for the whole simulation.
+# In real mode every call maps to time/threading. In virtual mode the clock counts the threads started through it
+# which are not blocked in sleep(), wait() or join(); when all of them are blocked, time jumps straight to the
+# earliest pending timer. Timers and keepalives behave the same, the simulation only skips the idle time.
+class Clock:
+    def __init__(self):
+        self.virtual = False
+
+        self.__lock = threading.Lock()
+        self.__now = 0.0
+        self.__timers = []
+        self.__seq = 0
+        self.__running = 0
+        self.__cond_waiters = {}
+
+    # must be called by the thread driving the simulation before any other thread is started
+    def set_virtual(self):
+        with self.__lock:
+            self.virtual = True
+            self.__now = 0.0
+            self.__running = 1
+
+    # the driving thread is done, let the remaining threads run out their timers
+    def leave(self):
+        if not self.virtual:
+            return
+
+        with self.__lock:
+            self.__running -= 1
+            self.__advance()
+
+    def __suspend(self, w, timeout):
+        if timeout is not None:
+            self.__seq += 1
+            heapq.heappush(self.__timers, (self.__now + max(timeout, 0), self.__seq, w))
+
+        self.__running -= 1
+        self.__advance()
+
+    def __resume(self, w, notified):
+        if w.fired:
+            return
+
+        w.fired = True
+        w.notified = notified
+        self.__running += 1
+        w.lock.release()
+
+    def __advance(self):
+        while self.__running == 0 and self.__timers:
+            deadline, seq, w = heapq.heappop(self.__timers)
+            if w.fired:
+                continue
+
+            if deadline > self.__now:
+                self.__now = deadline
+            self.__resume(w, False)
+
+    def __run(self, target, args):
+        try:
+            target(*args)
+        finally:
+            th = threading.current_thread()
+            with self.__lock:
+                th.clock_finished = True
+                for w in th.clock_joiners:
+                    self.__resume(w, True)
+                th.clock_joiners = []
+
+                self.__running -= 1
+                self.__advance()
+
+    def time(self):
+        if not self.virtual:
+            return _time.monotonic()
+
+        return self.__now
+
+    def sleep(self, seconds):
+        if not self.virtual:
+            _time.sleep(seconds)
+            return
+
+        w = _Waiter()
+        with self.__lock:
+            self.__suspend(w, seconds)
+        w.lock.acquire()
+
+    # same as cond.wait(timeout), the caller must hold cond
+    def wait(self, cond, timeout=None):
+        if not self.virtual:
+            return cond.wait(timeout)
+
+        w = _Waiter()
+        with self.__lock:
+            self.__cond_waiters.setdefault(cond, []).append(w)
+            self.__suspend(w, timeout)
+
+        cond.release()
+        w.lock.acquire()
+        cond.acquire()
+
+        if not w.notified:
+            with self.__lock:
+                waiters = self.__cond_waiters.get(cond)
+                if waiters and w in waiters:
+                    waiters.remove(w)
+
+        return w.notified
+
+    # same as cond.notify_all(), the caller must hold cond
+    def notify_all(self, cond):
+        if not self.virtual:
+            cond.notify_all()
+            return
+
+        with self.__lock:
+            for w in self.__cond_waiters.pop(cond, ()):
+                self.__resume(w, True)
+
+    def start_thread(self, target, args=()):
+        if not self.virtual:
+            th = threading.Thread(target=target, args=args)
+            th.start()
+            return th
+
+        th = threading.Thread(target=self.__run, args=(target, args))
+        th.clock_finished = False
+        th.clock_joiners = []
+
+        with self.__lock:
+            self.__running += 1
+        th.start()
+
+        return th
+
+    def join(self, th):
+        if self.virtual and hasattr(th, 'clock_joiners'):
+            w = _Waiter()
+            with self.__lock:
+                if th.clock_finished:
+                    w = None
+                else:
+                    th.clock_joiners.append(w)
+                    self.__suspend(w, None)
+
+            if w:
+                w.lock.acquire()
+
+        th.join()
+
+
+clock = Clock()
+
+
+def set_virtual():
+    clock.set_virtual()
+
+
+def leave():
+    clock.leave()
+
+
+def time():
+    return clock.time()
+
+
+def sleep(seconds):
+    clock.sleep(seconds)
+
+
+def wait(cond, timeout=None):
+    return clock.wait(cond, timeout)
+
+
+def notify_all(cond):
+    clock.notify_all(cond)
+
+
+def start_thread(target, args=()):
+    return clock.start_thread(target, args)
+
+
+def join(th):
+    clock.join(th)
@@ -1,5 +1,3 @@
-from time import sleep
-
 from scapy.all import *
 import scapy.all as scapy
 from scapy.layers.inet import IP, ICMP, Ether
@@ -10,6 +8,7 @@ from tools import cidr_to_netmask, ip_to_int, int_to_ip, debug_message
 from wire import Wire
 from interface import Interface
 from bgp import BGP
+from runtime import sleep
 
 
 def add_announced_network(r1, nlri):
@@ -42,7 +41,7 @@ def connect_bgp_routers(nlri1, nlri2, r1, r2):
 
 
 # Configuration 1. Two routers, the simplest configuration.
-def conf1(time_to_run):
+async def conf1(time_to_run):
     # Routers
     r1 = Router(501)
     r2 = Router(502)
@@ -84,14 +83,14 @@ def conf1(time_to_run):
         if c > time_to_run:
             break
 
-        sleep(1)
+        await sleep(1)
 
-    r1.off()
-    r2.off()
+    await r1.off()
+    await r2.off()
 
 
 # Configuration 2. Three interconnected routers.
-def conf2(time_to_run):
+async def conf2(time_to_run):
     # Routers
     r1 = Router(501)
     r2 = Router(502)
@@ -173,15 +172,15 @@ def conf2(time_to_run):
         if c > time_to_run:
             break
 
-        sleep(1)
+        await sleep(1)
 
-    r1.off()
-    r2.off()
-    r3.off()
+    await r1.off()
+    await r2.off()
+    await r3.off()
 
 
 # Configuration 3. Three interconnected routers, one goes on and off every 43 and 85 seconds.
-def conf3(time_to_run):
+async def conf3(time_to_run):
     # Routers
     r1 = Router(501)
     r2 = Router(502)
@@ -266,20 +265,20 @@ def conf3(time_to_run):
             r3.on()
 
         if c % 85 == 0:
-            r3.off()
+            await r3.off()
 
         if c > time_to_run:
             break
 
-        sleep(1)
+        await sleep(1)
 
-    r1.off()
-    r2.off()
-    r3.off()
+    await r1.off()
+    await r2.off()
+    await r3.off()
 
 
 # Configuration 4. Ring of 4 routers.
-def conf4(time_to_run):
+async def conf4(time_to_run):
     # Routers
     r501 = Router(501)
     r502 = Router(502)
@@ -305,21 +304,21 @@ def conf4(time_to_run):
     while True:
         c += 1
         if c == 30:
-            r504.off()
+            await r504.off()
 
         if c > time_to_run:
             break
 
-        sleep(1)
+        await sleep(1)
 
-    r501.off()
-    r502.off()
-    r503.off()
-    r504.off()
+    await r501.off()
+    await r502.off()
+    await r503.off()
+    await r504.off()
 
 
 # Configuration 5. Arbitrary configuration of 6 router with router 502 going offline after 40 sec.
-def conf5(time_to_run):
+async def conf5(time_to_run):
     # Routers
     r501 = Router(501)
     r502 = Router(502)
@@ -359,23 +358,23 @@ def conf5(time_to_run):
     while True:
         c += 1
         if c == 40:
-            r502.off()
+            await r502.off()
 
         if c > time_to_run:
             break
 
-        sleep(1)
+        await sleep(1)
 
-    r501.off()
-    r502.off()
-    r503.off()
-    r504.off()
-    r505.off()
-    r506.off()
+    await r501.off()
+    await r502.off()
+    await r503.off()
+    await r504.off()
+    await r505.off()
+    await r506.off()
 
 
 # Configuration 6. Twelve randomly connected routers. Router 502 goes offline after first 30 seconds of work.
-def conf6(time_to_run):
+async def conf6(time_to_run):
     # Routers
     r501 = Router(501)
     r502 = Router(502)
@@ -445,28 +444,28 @@ def conf6(time_to_run):
         c += 1
 
         if c == 30:
-            r502.off()
+            await r502.off()
 
         if c > time_to_run:
             break
 
-        sleep(1)
-
-    r501.off()
-    r502.off()
-    r503.off()
-    r504.off()
-    r505.off()
-    r506.off()
-    r507.off()
-    r508.off()
-    r509.off()
-    r510.off()
-    r511.off()
-    r512.off()
+        await sleep(1)
+
+    await r501.off()
+    await r502.off()
+    await r503.off()
+    await r504.off()
+    await r505.off()
+    await r506.off()
+    await r507.off()
+    await r508.off()
+    await r509.off()
+    await r510.off()
+    await r511.off()
+    await r512.off()
 
 # Configuration 7. Two routers pinging each other.
-def conf7(time_to_run):
+async def conf7(time_to_run):
     r501 = Router(501)
     r502 = Router(502)
     connect_bgp_routers('172.16.1.1/30', '172.16.1.2/30', r501, r502)
@@ -481,18 +480,18 @@ def conf7(time_to_run):
         c += 1
 
         if c % 10 == 0:
-            debug_message(1, 'r501', 'conf7', r501.ping('20.0.0.254', '10.0.0.254'))
-            debug_message(1, 'r502', 'conf7', r502.ping('10.0.0.254', '20.0.0.254'))
+            debug_message(1, 'r501', 'conf7', await r501.ping('20.0.0.254', '10.0.0.254'))
+            debug_message(1, 'r502', 'conf7', await r502.ping('10.0.0.254', '20.0.0.254'))
 
         if c > time_to_run:
             break
 
-        sleep(1)
+        await sleep(1)
 
-    r501.off()
-    r502.off()
+    await r501.off()
+    await r502.off()
 # Configuration 8. Two routers (501, 502) pinging each other through a medium BGP router 502.
-def conf8(time_to_run):
+async def conf8(time_to_run):
     r501 = Router(501)
     r502 = Router(502)
     r503 = Router(503)
@@ -512,20 +511,20 @@ def conf8(time_to_run):
     while True:
         c += 1
         if c % 10 == 0:
-            debug_message(1, 'r501', 'conf8', r501.ping('30.0.0.254', '10.0.0.254'))
-            debug_message(1, 'r503', 'conf8', r503.ping('10.0.0.254', '30.0.0.254'))
+            debug_message(1, 'r501', 'conf8', await r501.ping('30.0.0.254', '10.0.0.254'))
+            debug_message(1, 'r503', 'conf8', await r503.ping('10.0.0.254', '30.0.0.254'))
 
         if c > time_to_run:
             break
 
-        sleep(1)
+        await sleep(1)
 
-    r501.off()
-    r502.off()
-    r503.off()
+    await r501.off()
+    await r502.off()
+    await r503.off()
 
 # Configuration 9. Twelve randomly connected routers. Some pinging each other.
-def conf9(time_to_run):
+async def conf9(time_to_run):
     # Routers
     r501 = Router(501)
     r502 = Router(502)
@@ -598,27 +597,27 @@ def conf9(time_to_run):
             break
 
         if c > 60:
-            r507.off()
+            await r507.off()
 
         if c % 10 == 0:
-            debug_message(1, 'r501', 'conf9', r501.ping('70.0.0.254',   '10.0.0.254'))
-            debug_message(1, 'r501', 'conf9', r501.ping('122.0.0.254',  '10.0.0.254'))
-            debug_message(1, 'r512', 'conf9', r512.ping('61.0.0.254',   '120.0.0.254'))
+            debug_message(1, 'r501', 'conf9', await r501.ping('70.0.0.254',   '10.0.0.254'))
+            debug_message(1, 'r501', 'conf9', await r501.ping('122.0.0.254',  '10.0.0.254'))
+            debug_message(1, 'r512', 'conf9', await r512.ping('61.0.0.254',   '120.0.0.254'))
 
         if c > time_to_run:
             break
 
-        sleep(1)
-
-    r501.off()
-    r502.off()
-    r503.off()
-    r504.off()
-    r505.off()
-    r506.off()
-    r507.off()
-    r508.off()
-    r509.off()
-    r510.off()
-    r511.off()
-    r512.off()
\ No newline at end of file
+        await sleep(1)
+
+    await r501.off()
+    await r502.off()
+    await r503.off()
+    await r504.off()
+    await r505.off()
+    await r506.off()
+    await r507.off()
+    await r508.off()
+    await r509.off()
+    await r510.off()
+    await r511.off()
+    await r512.off()
\ No newline at end of file
@@ -0,0 +1,178 @@
+PREFIX_MASKS = [(0xffffffff << (32 - i)) & 0xffffffff for i in range(33)]
+
+
+def mask_to_prefix_len(mask):
+    return bin(mask).count('1')
+
+
+class FibNode:
+    __slots__ = ('network', 'prefix_len', 'routes', 'children', 'owner')
+
+    def __init__(self, network, prefix_len, owner=None):
+        self.network = network
+        self.prefix_len = prefix_len
+        self.routes = []
+        self.children = [None, None]
+        # the Fib which may change this node in place
+        self.owner = owner
+
+
+# Path-compressed binary trie (patricia) over integer IPv4 prefixes.
+# Every node stores the routes for exactly one prefix, nodes without routes exist only where two branches split,
+# so a lookup visits at most prefix length nodes no matter how many routes are installed.
+#
+# snapshot() returns a version which never changes, it shares every node with this Fib. Nodes made before the
+# last snapshot are copied, together with the path from the root to them, when add() or remove() changes them
+# for the first time, so a batch of changes copies every node it touches once. Readers of a snapshot need no lock.
+class Fib:
+    def __init__(self, root=None, size=0):
+        # token of the nodes this Fib made since its last snapshot
+        self.__owner = object()
+        self.__root = root or FibNode(0, 0, self.__owner)
+        self.__size = size
+
+    def __len__(self):
+        return self.__size
+
+    def __iter__(self):
+        stack = [self.__root]
+        while stack:
+            node = stack.pop()
+            yield from node.routes
+            for child in reversed(node.children):
+                if child:
+                    stack.append(child)
+
+    def snapshot(self):
+        self.__owner = object()
+        return Fib(self.__root, self.__size)
+
+    # node, or a copy of it which this Fib may change
+    def __own(self, node):
+        if node.owner is self.__owner:
+            return node
+
+        copy = FibNode(node.network, node.prefix_len, self.__owner)
+        copy.routes = list(node.routes)
+        copy.children = list(node.children)
+        return copy
+
+    def __find(self, network, prefix_len):
+        parent = None
+        node = self.__root
+        while node and node.prefix_len < prefix_len:
+            if (network ^ node.network) & PREFIX_MASKS[node.prefix_len]:
+                return None, None
+            parent = node
+            node = node.children[(network >> (31 - node.prefix_len)) & 1]
+
+        if node and node.prefix_len == prefix_len and node.network == network:
+            return parent, node
+
+        return None, None
+
+    def get(self, network, mask):
+        parent, node = self.__find(network & mask, mask_to_prefix_len(mask))
+        if node:
+            return node.routes
+        return []
+
+    def add(self, route):
+        prefix_len = mask_to_prefix_len(route.mask)
+        network = route.network & PREFIX_MASKS[prefix_len]
+        node = self.__root = self.__own(self.__root)
+
+        while True:
+            if node.prefix_len == prefix_len:
+                node.routes.append(route)
+                break
+
+            bit = (network >> (31 - node.prefix_len)) & 1
+            child = node.children[bit]
+
+            if not child:
+                leaf = FibNode(network, prefix_len, self.__owner)
+                leaf.routes.append(route)
+                node.children[bit] = leaf
+                break
+
+            common = min(prefix_len, child.prefix_len, 32 - (network ^ child.network).bit_length())
+            if common == child.prefix_len:
+                child = node.children[bit] = self.__own(child)
+                node = child
+                continue
+
+            # split the edge, new node is fully built before it gets linked so lookups never see a half-made branch
+            split = FibNode(network & PREFIX_MASKS[common], common, self.__owner)
+            split.children[(child.network >> (31 - common)) & 1] = child
+            if common == prefix_len:
+                split.routes.append(route)
+            else:
+                leaf = FibNode(network, prefix_len, self.__owner)
+                leaf.routes.append(route)
+                split.children[(network >> (31 - common)) & 1] = leaf
+            node.children[bit] = split
+            break
+
+        self.__size += 1
+
+    def remove(self, route):
+        prefix_len = mask_to_prefix_len(route.mask)
+        network = route.network & PREFIX_MASKS[prefix_len]
+        _, node = self.__find(network, prefix_len)
+        if not node or route not in node.routes:
+            return False
+
+        # the nodes from the root down to the one of the route, all of them may be changed
+        path = [self.__own(self.__root)]
+        self.__root = path[0]
+        while path[-1].prefix_len < prefix_len:
+            parent = path[-1]
+            bit = (network >> (31 - parent.prefix_len)) & 1
+            path.append(self.__own(parent.children[bit]))
+            parent.children[bit] = path[-1]
+
+        node = path.pop()
+        node.routes.remove(route)
+        self.__size -= 1
+
+        # collapse nodes which do not hold routes and do not split anything anymore
+        while path and not node.routes:
+            children = [c for c in node.children if c]
+            if len(children) == 2:
+                break
+
+            parent = path[-1]
+            bit = (node.network >> (31 - parent.prefix_len)) & 1
+            parent.children[bit] = children[0] if children else None
+            if children:
+                break
+
+            node = path.pop()
+
+        return True
+
+    def lookup(self, ip):
+        found = None
+        node = self.__root
+        while node:
+            if (ip ^ node.network) & PREFIX_MASKS[node.prefix_len]:
+                break
+
+            if node.routes:
+                found = node.routes
+
+            if node.prefix_len == 32:
+                break
+
+            node = node.children[(ip >> (31 - node.prefix_len)) & 1]
+
+        if not found:
+            return None
+
+        best = found[0]
+        for r in found:
+            if r.metric < best.metric:
+                best = r
+
+        return best
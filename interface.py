@@ -1,5 +1,6 @@
+import socket
+import struct
 import threading
-from time import sleep
 from random import randint
 
 from scapy.contrib.bgp import BGPKeepAlive
@@ -7,13 +8,19 @@ from scapy.layers.l2 import ARP
 from scapy.layers.inet import IP, ICMP, Ether
 from scapy.all import *
 
+import runtime
+from arp import NeighbourTable
+from stats import Counters
+from tools import mac_to_bytes, craft_arp_frame, ETHER_BROADCAST_BYTES, ETHER_TYPE_IP, ETHER_TYPE_ARP
+
+ARP_OP = struct.Struct('!H')
+
 
 class Interface:
     def __init__(self, ip, mask):
         self.__router = None
         self.__wire = None
-        self.__arp_table = {}
-        self.__cache = []
+        self.__neighbours = NeighbourTable()
         self.__th_main = None
 
         self.mac = "02:00:00:%02x:%02x:%02x" % (random.randint(0, 255),
@@ -23,68 +30,89 @@ class Interface:
         self.mask = mask
         self.state = 0
 
-    def __main_thread(self):
+        self.__mac_bytes = mac_to_bytes(self.mac)
+        self.__ip_bytes = socket.inet_aton(ip)
+
+        self.counters = Counters('interface', ['frames_sent', 'frames_received', 'arp_requests_sent',
+                                               'arp_replies_sent', 'arp_replies_received'],
+                                 {'arp_entries': lambda: len(self.__neighbours),
+                                  'arp_pending': lambda: self.__neighbours.pending(),
+                                  'arp_dropped': lambda: self.__neighbours.dropped},
+                                 ip=ip)
+
+    async def __main_thread(self):
         while self.state:
             if not self.__wire:
-                sleep(2)
+                await runtime.sleep(2)
                 continue
 
-            packet = self.__wire.pop(self.mac)
-
-            if packet:
-                if packet.haslayer(ARP):
-                    if packet[ARP].op == 1:
-                        if packet.pdst == self.ip:
-                            reply = ARP(op=2, hwsrc=self.mac, psrc=self.ip, pdst=packet[ARP].psrc,
-                                        hwdst=packet[ARP].hwsrc)
-                            full_packet = Ether(dst=packet[ARP].hwsrc, src=self.mac) / reply
-                            self.__wire.push(full_packet)
-                    elif packet[ARP].op == 2:
-                        self.__arp_table[packet[ARP].psrc] = packet[ARP].hwsrc
-
-                else:
-                    self.__router.receive_data(self, packet.getlayer(IP))
-
-            # iterate through __cache, send stored packets
-            tmp = []
-            for i in range(len(self.__cache)):
-                data = self.__cache[i]
-                packet = data[0]
-                dst_ip = data[1]
-
-                if dst_ip in self.__arp_table:
-                    full_packet = Ether(src=self.mac, dst=self.__arp_table[dst_ip]) / packet
-                    self.__wire.push(full_packet)
-                else:
-                    tmp.append(self.__cache[i])
-            self.__cache = tmp
-
-            sleep(0.001)
+            frame = await self.__wire.pop(self.__mac_bytes, 1)
+
+            # frames are bytes, only the fields needed to pass them on are read, the router dissects
+            # the packets which are for itself
+            if frame:
+                self.counters['frames_received'] += 1
+                ether_type = frame[12:14]
+                if ether_type == ETHER_TYPE_ARP:
+                    op = ARP_OP.unpack_from(frame, 20)[0]
+                    if op == 1:
+                        # the asking side is learned too, it is about to be answered to
+                        if frame[38:42] == self.__ip_bytes:
+                            self.__arp_learn(frame[28:32], frame[22:28])
+                            self.__wire.push(craft_arp_frame(2, self.__mac_bytes, self.__ip_bytes,
+                                                             frame[22:28], frame[28:32]))
+                            self.counters['arp_replies_sent'] += 1
+                    elif op == 2:
+                        self.counters['arp_replies_received'] += 1
+                        self.__arp_learn(frame[28:32], frame[22:28])
+
+                elif ether_type == ETHER_TYPE_IP:
+                    self.__router.receive_packet(self, frame[14:])
+
+            for ip in self.__neighbours.expire():
+                self.__arp_request(ip)
+
+    # store the address and send the packets which were waiting for it
+    def __arp_learn(self, ip_bytes, mac):
+        for packet in self.__neighbours.update(socket.inet_ntoa(ip_bytes), mac):
+            self.__wire.push(mac + self.__mac_bytes + ETHER_TYPE_IP + packet)
+            self.counters['frames_sent'] += 1
+
+    def __arp_request(self, ip):
+        self.__wire.push(craft_arp_frame(1, self.__mac_bytes, self.__ip_bytes, bytes(6),
+                                         socket.inet_aton(ip), ETHER_BROADCAST_BYTES))
+        self.counters['arp_requests_sent'] += 1
 
     def on(self):
         self.state = 1
-        self.__th_main = threading.Thread(target=self.__main_thread)
-        self.__th_main.start()
+        self.__th_main = runtime.start(self.__main_thread)
 
-    def off(self):
+    async def off(self):
         self.state = 0
-        self.__th_main.join()
+        if self.__wire:
+            self.__wire.wake(self.__mac_bytes)
+        await runtime.join(self.__th_main)
+        self.__neighbours.clear()
 
     def install(self, d):
         self.__router = d
+        self.counters.labels['router'] = d.name
 
     def connect_wire(self, w):
         self.__wire = w
+        w.attach(self.mac)
 
+    # packet is an IP packet, as bytes or a scapy packet
     def send_data(self, packet, gw=None):
-        dst_ip = packet.dst
-        if gw:
-            dst_ip = gw
-
-        if dst_ip not in self.__arp_table:
-            arp = Ether(src=self.mac, dst=ETHER_BROADCAST) / ARP(op=1, hwsrc=self.mac, psrc=self.ip, pdst=dst_ip)
-            self.__wire.push(arp)
-            self.__cache.append((packet, dst_ip))
+        if isinstance(packet, bytes):
+            dst_ip = gw or socket.inet_ntoa(packet[16:20])
         else:
-            full_packet = Ether(src=self.mac, dst=self.__arp_table[dst_ip]) / packet
-            self.__wire.push(full_packet)
+            dst_ip = gw or packet.dst
+            packet = bytes(packet)
+
+        dst_mac, send_request = self.__neighbours.resolve(dst_ip, packet)
+        if dst_mac:
+            self.__wire.push(dst_mac + self.__mac_bytes + ETHER_TYPE_IP + packet)
+            self.counters['frames_sent'] += 1
+        elif send_request:
+            self.__arp_request(dst_ip)
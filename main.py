@@ -6,6 +6,14 @@ import sys
 sys.stderr = None
 from examples import conf9, conf8, conf7, conf6, conf5, conf4, conf3, conf2, conf1
 import tools
+import capture
+import clock
+import bgp
+import runtime
+import stats
+import topology
+import mrt
+import router
 
 sys.stderr = sys.__stderr__
 
@@ -15,16 +23,63 @@ def get_args():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("-c", type=int, help="Configuration to run (1 - 9)")
     group.add_argument("-s", action='store_true', help="Display info on configurations available")
+    group.add_argument("-f", type=str, help="Run the topology from this JSON or YAML file")
+    group.add_argument("-g", type=str, help="Run a generated topology, as kind:ases[:prefixes per AS], kind one of "
+                                            + ", ".join(topology.GENERATORS))
 
     parser.add_argument("-d", type=int, default=1, help="Debug level (0 - 5)")
+    parser.add_argument("-ds", type=str, action='append', default=[],
+                        help="Debug level of one router or BGP session, as r501=5 or 501-502=5, may be repeated")
     parser.add_argument("-t", type=int, default=180, help="Time to execute simulation")
+    parser.add_argument("-p", type=str, default=None, help="Write frames from all wires to this pcap file")
+    parser.add_argument("-pr", type=int, default=0, help="Rotate the pcap file after this many megabytes")
+    parser.add_argument("-m", type=str, default=None, help="Write performance counters to this file")
+    parser.add_argument("-mf", type=str, default='prometheus', choices=['prometheus', 'json'],
+                        help="Counters file format: Prometheus text (rewritten) or JSON lines (appended)")
+    parser.add_argument("-mp", type=float, default=10, help="Seconds between two writes of the counters file")
+    parser.add_argument("-u", type=str, default=None, help="Record received BGP updates to this MRT (BGP4MP) file")
+    parser.add_argument("-x", type=str, default=None,
+                        help="Dump the BGP table of every router to DIR/<router>.mrt (TABLE_DUMP_V2) before the end")
+    parser.add_argument("-xb", action='store_true', help="Dump only the best routes instead of the whole BGP table")
+    parser.add_argument("-v", action='store_true', help="Run on a virtual clock, idle time is skipped")
+    parser.add_argument("-n", action='store_true', help="Encode BGP messages with the native codec instead of scapy")
+    parser.add_argument("-r", type=str, default='threads', choices=['threads', 'asyncio'],
+                        help="Runtime: a thread per object or one asyncio event loop")
 
     return parser.parse_args()
 
 
+# Snapshots the BGP table of every router which is on half a second before the scenario turns them off.
+# They are written from a thread of their own, so the simulation goes on meanwhile.
+async def dump_ribs(directory, time_to_run, best_only):
+    await runtime.sleep(time_to_run - 0.5)
+
+    snapshots = [(os.path.join(directory, f"{r.name}.mrt"), mrt.rib_snapshot(r, best_only))
+                 for r in sorted(router.instances, key=lambda r: r.name) if r.state]
+
+    th = threading.Thread(target=lambda: [mrt.write_rib(*s) for s in snapshots])
+    th.start()
+    rib_writers.append(th)
+
+
+async def run_scenario(scenario):
+    if args.x:
+        os.makedirs(args.x, exist_ok=True)
+        th = runtime.start(dump_ribs, (args.x, args.t, args.xb))
+
+    await scenario
+
+    if args.x:
+        await runtime.join(th)
+
+
+rib_writers = []
 args = get_args()
 
-tools.debug_level = args.d
+tools.set_debug_level(args.d)
+for ds in args.ds:
+    key, level = ds.split('=')
+    tools.set_debug_level(int(level), key)
 
 if args.s:
     print("Configuration 1. Two routers, the simplest configuration.")
@@ -38,24 +93,39 @@ if args.s:
     print("Configuration 9. Twelve randomly connected routers. Some pinging each other.")
     exit()
 else:
-    c = args.c
-    if c == 1:
-        conf1(args.t)
-    elif c == 2:
-        conf2(args.t)
-    elif c == 3:
-        conf3(args.t)
-    elif c == 4:
-        conf4(args.t)
-    elif c == 5:
-        conf5(args.t)
-    elif c == 6:
-        conf6(args.t)
-    elif c == 7:
-        conf7(args.t)
-    elif c == 8:
-        conf8(args.t)
-    elif c == 9:
-        conf9(args.t)
+    if args.r == 'asyncio':
+        runtime.use_asyncio(virtual=args.v)
+    elif args.v:
+        clock.set_virtual()
+
+    if args.n:
+        bgp.default_codec = 'native'
+
+    if args.p:
+        capture.start_capture(args.p, max_bytes=args.pr * 1024 * 1024)
+
+    if args.m:
+        stats.start_export(args.m, fmt=args.mf, period=args.mp)
+
+    if args.u:
+        mrt.start_recording(args.u)
+
+    confs = [conf1, conf2, conf3, conf4, conf5, conf6, conf7, conf8, conf9]
+    if args.f:
+        scenario = topology.Topology.load(args.f).run(args.t)
+    elif args.g:
+        kind, n, *prefixes = args.g.split(':')
+        scenario = topology.generate(kind, int(n), int(prefixes[0]) if prefixes else 1).run(args.t)
+    elif 1 <= args.c <= len(confs):
+        scenario = confs[args.c - 1](args.t)
+    else:
+        exit(f"Unknown configuration {args.c}")
 
+    runtime.run(run_scenario(scenario))
+    for th in rib_writers:
+        th.join()
 
+    clock.leave()
+    capture.stop_capture()
+    stats.stop_export()
+    mrt.stop_recording()
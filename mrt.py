@@ -0,0 +1,359 @@
+import bz2
+import gzip
+import queue
+import struct
+import threading
+import time
+
+import bgpcodec
+import runtime
+from tools import NETMASKS, debug_message, ip_to_int
+
+MRT_HEADER = struct.Struct('!IHHI')
+TABLE_DUMP_V2 = 13
+PEER_INDEX_TABLE = 1
+RIB_IPV4_UNICAST = 2
+RIB_IPV4_UNICAST_ADDPATH = 8
+BGP4MP_ET = 17
+BGP4MP_MESSAGE_AS4 = 4
+AFI_IPV4 = 1
+# peer type with an IPv4 address and a 4 byte AS number
+PEER_TYPE_AS4 = 2
+
+ATTR_FLAG_EXTENDED = 0x10
+ATTR_AS_PATH = 2
+ATTR_NEXT_HOP = 3
+AS_SET = 1
+
+U16 = struct.Struct('!H')
+U32 = struct.Struct('!I')
+ENTRY_HEADER = struct.Struct('!HIH')
+ENTRY_HEADER_ADDPATH = struct.Struct('!HIIH')
+PEER_ENTRY = struct.Struct('!BIII')
+BGP4MP_HEADER = struct.Struct('!IIHHII')
+
+
+# level 9 makes writing full tables several times slower for a few percent smaller files
+def open_dump(filename, mode='rb'):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode, compresslevel=6)
+    if filename.endswith('.bz2'):
+        return bz2.open(filename, mode)
+
+    return open(filename, mode)
+
+
+# (bgp_id, ip, as) for every peer of a PEER_INDEX_TABLE body, addresses as ints, IPv6 peers as None
+def parse_peer_index(body):
+    view_len = U16.unpack_from(body, 4)[0]
+    offset = 6 + view_len
+    count = U16.unpack_from(body, offset)[0]
+    offset += 2
+
+    peers = []
+    for _ in range(count):
+        peer_type = body[offset]
+        bgp_id = U32.unpack_from(body, offset + 1)[0]
+        offset += 5
+
+        if peer_type & 1:
+            ip = None
+            offset += 16
+        else:
+            ip = U32.unpack_from(body, offset)[0]
+            offset += 4
+
+        if peer_type & 2:
+            peer_as = U32.unpack_from(body, offset)[0]
+            offset += 4
+        else:
+            peer_as = U16.unpack_from(body, offset)[0]
+            offset += 2
+
+        peers.append((bgp_id, ip, peer_as))
+
+    return peers
+
+
+# (next_hop, path) from path attributes, AS numbers in TABLE_DUMP_V2 are always 4 bytes, AS_SETs are flattened
+def parse_attributes(attrs):
+    next_hop = 0
+    path = ()
+    offset = 0
+    end = len(attrs)
+
+    while offset < end:
+        flags = attrs[offset]
+        code = attrs[offset + 1]
+        if flags & ATTR_FLAG_EXTENDED:
+            length = U16.unpack_from(attrs, offset + 2)[0]
+            offset += 4
+        else:
+            length = attrs[offset + 2]
+            offset += 3
+
+        if code == ATTR_AS_PATH:
+            path = []
+            segment = offset
+            while segment < offset + length:
+                count = attrs[segment + 1]
+                path.extend(struct.unpack_from(f'!{count}I', attrs, segment + 2))
+                segment += 2 + 4 * count
+            path = tuple(path)
+        elif code == ATTR_NEXT_HOP:
+            next_hop = U32.unpack_from(attrs, offset)[0]
+
+        offset += length
+
+    return next_hop, path
+
+
+# Streams the IPv4 unicast RIB of a TABLE_DUMP_V2 file as (network, mask, peer_as, next_hop, path) tuples,
+# one per prefix: the entry of peer (an index into the peer table) or the first entry when peer is None.
+# Other record types and IPv6 are skipped. Entries with the same attributes share one parsed (next_hop, path).
+def read_rib(f, peer=None, cache_size=100000):
+    peers = []
+    cache = {}
+
+    while True:
+        header = f.read(MRT_HEADER.size)
+        if len(header) < MRT_HEADER.size:
+            break
+
+        timestamp, mrt_type, subtype, length = MRT_HEADER.unpack(header)
+        body = f.read(length)
+        if len(body) < length:
+            break
+
+        if mrt_type != TABLE_DUMP_V2:
+            continue
+
+        if subtype == PEER_INDEX_TABLE:
+            peers = parse_peer_index(body)
+            continue
+
+        if subtype == RIB_IPV4_UNICAST:
+            entry_header = ENTRY_HEADER
+        elif subtype == RIB_IPV4_UNICAST_ADDPATH:
+            entry_header = ENTRY_HEADER_ADDPATH
+        else:
+            continue
+
+        prefix_len = body[4]
+        size = (prefix_len + 7) // 8
+        network = int.from_bytes(body[5:5 + size] + bytes(4 - size), 'big')
+        offset = 5 + size
+        count = U16.unpack_from(body, offset)[0]
+        offset += 2
+
+        for _ in range(count):
+            fields = entry_header.unpack_from(body, offset)
+            peer_index = fields[0]
+            attr_len = fields[-1]
+            offset += entry_header.size
+
+            if peer is None or peer_index == peer:
+                attrs = body[offset:offset + attr_len]
+                parsed = cache.get(attrs)
+                if parsed is None:
+                    if len(cache) >= cache_size:
+                        cache.clear()
+                    parsed = cache[attrs] = parse_attributes(attrs)
+
+                peer_as = peers[peer_index][2] if peer_index < len(peers) else 0
+                yield network, NETMASKS[prefix_len], peer_as, parsed[0], parsed[1]
+                break
+
+            offset += attr_len
+
+
+# Loads the IPv4 RIB of an MRT dump into router's BGP table as if learned from a virtual upstream with AS source,
+# which is put in front of paths not starting with it. Without source the routes come from the AS of the MRT peer.
+# next_hop replaces the next hops of the dump, which are unreachable in the simulation.
+# Returns the number of routes loaded.
+def load_rib(router, filename, source=None, peer=None, next_hop=None, advertise=False, batch_size=10000):
+    def routes(f):
+        for network, mask, peer_as, hop, path in read_rib(f, peer):
+            if source is not None and (not path or path[0] != source):
+                path = (source,) + path
+            yield network, mask, hop if next_hop is None else next_hop, path
+
+    with open_dump(filename) as f:
+        count = router.load_bgp_routes(routes(f), source, advertise, batch_size)
+
+    debug_message(4, f"Router {router.name}", "load_rib", "Loaded %s routes from %s.", count, filename)
+
+    return count
+
+
+def encode_record(timestamp, mrt_type, subtype, body):
+    return MRT_HEADER.pack(int(timestamp), mrt_type, subtype, len(body)) + body
+
+
+def encode_peer_index(collector_id, peers, view_name=''):
+    view_name = view_name.encode()
+    body = U32.pack(collector_id) + U16.pack(len(view_name)) + view_name + U16.pack(len(peers))
+
+    return body + b''.join(PEER_ENTRY.pack(PEER_TYPE_AS4, bgp_id, ip, peer_as) for bgp_id, ip, peer_as in peers)
+
+
+# One RIB_IPV4_UNICAST record per prefix of entries, which yields ((network, mask), routes) in the order to write.
+# peer_indexes maps the source of a route to its index in the peer table.
+def rib_records(entries, peer_indexes, timestamp, cache_size=100000):
+    cache = {}
+
+    for sequence, ((network, mask), routes) in enumerate(entries):
+        body = [U32.pack(sequence & 0xffffffff), bgpcodec.encode_prefix(network, mask), b'']
+
+        for r in routes:
+            attrs = cache.get(r.attributes)
+            if attrs is None:
+                if len(cache) >= cache_size:
+                    cache.clear()
+                attrs = cache[r.attributes] = bgpcodec.encode_path_attributes(r.path, r.next_hop)
+
+            body.append(ENTRY_HEADER.pack(peer_indexes[r.source], int(timestamp), len(attrs)))
+            body.append(attrs)
+
+        body[2] = U16.pack((len(body) - 3) // 2)
+        yield encode_record(timestamp, TABLE_DUMP_V2, RIB_IPV4_UNICAST, b''.join(body))
+
+
+# What write_rib() needs of router: (collector_id, view_name, peers, peer_indexes, entries).
+# Every route of every prefix (Adj-RIB-In) or with best_only the selected best routes (Loc-RIB), read from a
+# snapshot of the tables, so it is taken at once and written later while the router keeps working.
+# Sources without a BGP session, like the upstream of load_rib(), are peers with address 0.0.0.0.
+def rib_snapshot(router, best_only=False):
+    table, best = router.get_bgp_snapshot()
+
+    if best_only:
+        entries = ((key, (best[key],)) for key in sorted(best))
+        sources = {r.source for r in best.values()}
+    else:
+        entries = ((key, table[key]) for key in sorted(table))
+        sources = {r.source for routes in table.values() for r in routes}
+
+    neighbours = router.get_bgp_neighbours()
+    peers = []
+    peer_indexes = {}
+    for source in sorted(sources):
+        ip = ip_to_int(neighbours[source]) if source in neighbours else 0
+        peer_indexes[source] = len(peers)
+        peers.append((ip, ip, source))
+
+    interfaces = sorted(router.get_interfaces())
+    collector_id = ip_to_int(interfaces[0]) if interfaces else 0
+
+    return collector_id, router.name, peers, peer_indexes, entries
+
+
+# Streams a snapshot to a TABLE_DUMP_V2 file, timestamps are the wall clock. Returns the number of prefixes written.
+def write_rib(filename, snapshot):
+    collector_id, view_name, peers, peer_indexes, entries = snapshot
+    timestamp = time.time()
+
+    count = 0
+    with open_dump(filename, 'wb') as f:
+        f.write(encode_record(timestamp, TABLE_DUMP_V2, PEER_INDEX_TABLE,
+                              encode_peer_index(collector_id, peers, view_name)))
+        for record in rib_records(entries, peer_indexes, timestamp):
+            f.write(record)
+            count += 1
+
+    debug_message(4, f"Router {view_name}", "write_rib", "Dumped %s prefixes to %s.", count, filename)
+
+    return count
+
+
+def dump_rib(router, filename, best_only=False):
+    return write_rib(filename, rib_snapshot(router, best_only))
+
+
+# Writes the UPDATE messages BGP instances receive as BGP4MP_ET records from a background thread.
+# Receiving only puts the data into a bounded queue, data is dropped (and counted) when the writer can not keep up.
+# Timestamps are the wall clock when the recorder was created plus the runtime time since then, with microseconds.
+class UpdateRecorder:
+    def __init__(self, filename, queue_size=10000):
+        self.filename = filename
+        self.dropped = 0
+        self.written = 0
+        self.epoch = time.time() - runtime.time()
+
+        self.__queue = queue.Queue(queue_size)
+        self.__th_main = None
+        self.state = 0
+
+    def __records(self, timestamp, peer_as, local_as, peer_ip, local_ip, data):
+        timestamp += self.epoch
+        seconds = int(timestamp)
+        header = U32.pack(int((timestamp - seconds) * 1000000)) + BGP4MP_HEADER.pack(
+            peer_as, local_as, 0, AFI_IPV4, ip_to_int(peer_ip), ip_to_int(local_ip))
+
+        offset = 0
+        while offset + bgpcodec.HEADER_LEN <= len(data):
+            marker, length, msg_type = bgpcodec.HEADER.unpack_from(data, offset)
+            if length < bgpcodec.HEADER_LEN:
+                break
+
+            if msg_type == bgpcodec.TYPE_UPDATE:
+                yield encode_record(seconds, BGP4MP_ET, BGP4MP_MESSAGE_AS4, header + data[offset:offset + length])
+            offset += length
+
+    def __main_thread(self):
+        with open_dump(self.filename, 'wb') as f:
+            while self.state or not self.__queue.empty():
+                try:
+                    item = self.__queue.get(timeout=0.5)
+                except queue.Empty:
+                    f.flush()
+                    continue
+
+                for record in self.__records(*item):
+                    f.write(record)
+                    self.written += 1
+
+    # data is what one BGP instance received at once, messages other than UPDATE are skipped
+    def write(self, timestamp, peer_as, local_as, peer_ip, local_ip, data):
+        try:
+            self.__queue.put_nowait((timestamp, peer_as, local_as, peer_ip, local_ip, data))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        if self.state:
+            return
+
+        self.state = 1
+        self.__th_main = threading.Thread(target=self.__main_thread, daemon=True)
+        self.__th_main.start()
+
+    def stop(self):
+        if not self.state:
+            return
+
+        self.state = 0
+        self.__th_main.join()
+        debug_message(4, "UpdateRecorder", "stop", "Recording %s stopped. Written %s, dropped %s.",
+                      self.filename, self.written, self.dropped)
+
+
+# recorder every BGP instance writes received updates to, None disables recording
+default_recorder = None
+
+
+def start_recording(filename, **kwargs):
+    global default_recorder
+
+    stop_recording()
+    default_recorder = UpdateRecorder(filename, **kwargs)
+    default_recorder.start()
+
+    return default_recorder
+
+
+def stop_recording():
+    global default_recorder
+
+    if default_recorder:
+        default_recorder.stop()
+        default_recorder = None
@@ -1,8 +1,14 @@
 from tools import ip_to_int
 
 
+# FIB entry, routes are never changed once installed, a new route replaces the old one.
+# adjacency is where matching packets go, (Interface, next hop IP string or None for the destination itself),
+# None when the next hop can not be reached. It belongs to this process and is dropped when the route is pickled,
+# a routing table sent from a shard holds plain values only.
 class Route:
-    def __init__(self, network, mask, gw, source, interface=0, metric=0, bgp_route=None):
+    __slots__ = ('network', 'mask', 'gw', 'interface', 'source', 'metric', 'bgp_route', 'adjacency')
+
+    def __init__(self, network, mask, gw, source, interface=0, metric=0, bgp_route=None, adjacency=None):
         self.mask = ip_to_int(mask)
         self.network = ip_to_int(network)
         self.network &= self.mask
@@ -20,3 +26,13 @@ class Route:
 
         if bgp_route and self.source == 'B':
             self.bgp_route = bgp_route
+
+        self.adjacency = adjacency
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != 'adjacency'}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.adjacency = None
@@ -1,13 +1,23 @@
+import socket
 import threading
-from time import sleep
+import weakref
 from random import randint
 
 from scapy.contrib.bgp import BGPKeepAlive
 from scapy.layers.inet import IP, ICMP, Ether, TCP
+from scapy.packet import Raw
 
-from bgproute import BGPRoute
+from bgproute import BGPRoute, attributes
+from bgptable import BGPTable
+from fib import Fib
 from route import Route
-from tools import ip_to_int, int_to_ip, debug_message, del_from_list, ip_in_network
+from tools import ip_to_int, int_to_ip, debug_message, debug_enabled
+
+import runtime
+from stats import Counters
+
+# every router created in this process, for tools which watch a running simulation
+instances = weakref.WeakSet()
 
 
 class Router:
@@ -16,10 +26,20 @@ class Router:
         self.__bgp = {}
         self.__sockets = {}
         self.__th_main = None
+        # the control plane changes __routing_table under the lock and publishes a snapshot of it to __fib
+        # once per batch, forwarding reads __fib without a lock
         self.__routing_table_lock = threading.Lock()
-        self.__routing_table = []
+        self.__routing_table = Fib()
+        self.__fib = self.__routing_table.snapshot()
+        # connected routes only, BGP next hops are resolved against them
+        self.__connected = Fib()
+        # Interface (None for unresolved) -> BGP routes of __routing_table whose next hop is reached through it
+        self.__dependents = {}
         self.__bgp_routing_table_lock = threading.Lock()
-        self.__bgp_routing_table = []
+        self.__bgp_routing_table = BGPTable()
+        self.__best_bgp_routes = {}
+        self.__dirty_lock = threading.Condition(threading.Lock())
+        self.__dirty_prefixes = set()
         self.__propagated_bgp_networks = []
 
         self.__ping_lock = threading.Lock()
@@ -31,105 +51,195 @@ class Router:
         if not name:
             self.name = 'r' + str(as_id)
 
+        self.__debug_source = f"Router {self.name}"
+
+        self.counters = Counters('router', ['fib_lookups', 'fib_misses', 'packets_received', 'packets_forwarded',
+                                            'best_path_changes'],
+                                 {'fib_routes': lambda: len(self.__fib),
+                                  'bgp_routes': lambda: len(self.__bgp_routing_table),
+                                  'dirty_prefixes': lambda: len(self.__dirty_prefixes)},
+                                 router=self.name)
+        instances.add(self)
+
         self.as_id = as_id
         self.state = 0
-
+        # seconds between BGP session checks and the delay used to batch changed prefixes
+        self.check_period = 5
+        self.decision_delay = 0.05
 
     def __get_route(self, ip):
         if isinstance(ip, str):
             ip = ip_to_int(ip)
-        found_route = None
 
-        with self.__routing_table_lock:
-            current_table = self.__routing_table
-
-        for r in current_table:
-            if ip_in_network(r.network, r.mask, ip):
-                if not found_route:
-                    found_route = r
-                elif r.mask == found_route.mask:
-                    if r.metric < found_route.metric:
-                        found_route = r
-                elif r.mask > found_route.mask:
-                    found_route = r
-
-        return found_route
-
-    def __get_best_bgp_routes(self):
-        store = {}
-        with self.__bgp_routing_table_lock:
-            for r in self.__bgp_routing_table:
-                key = str(r.network) + "_" + str(r.mask)
-                if key not in store:
-                    store[key] = r
-                else:
-                    if len(r.path) < len(store[key].path):
-                        store[key] = r
+        self.counters['fib_lookups'] += 1
+        route = self.__fib.lookup(ip)
+
+        if route is None:
+            self.counters['fib_misses'] += 1
 
-        return store
+        return route
 
+    # (Interface, next hop) through which gw is reached, None when no connected network holds it
+    def __resolve(self, gw):
+        connected = self.__connected.lookup(gw)
+        if connected is None:
+            return None
+
+        return connected.adjacency[0], int_to_ip(gw)
+
+    # FIB entry for a BGP route, resolved against the connected networks as they are now
+    def __bgp_fib_route(self, bgp_route):
+        return Route(bgp_route.network, bgp_route.mask, bgp_route.next_hop, 'B', bgp_route=bgp_route,
+                     adjacency=self.__resolve(bgp_route.next_hop))
+
+    def __forget(self, r):
+        if r.source == 'B':
+            key = r.adjacency[0] if r.adjacency else None
+            self.__dependents[key].discard(r)
+            if not self.__dependents[key]:
+                del self.__dependents[key]
+
+    # __add_route(), __drop_route() and __add_connected() change __routing_table only, the caller holds
+    # __routing_table_lock and calls __publish() when the whole batch is done
     def __add_route(self, r1):
         to_remove = None
-        for key in range(len(self.__routing_table)):
-            r2 = self.__routing_table[key]
-            if r1.network == r2.network and r1.mask == r2.mask and r1.metric == r2.metric:
+        for r2 in self.__routing_table.get(r1.network, r1.mask):
+            if r1.metric == r2.metric:
                 if r2.source == 'B' and r1.source == 'B':
-                    if len(r1.bgp_route.path) == len(r2.bgp_route.path) or len(r1.bgp_route.path) > len(
-                            r2.bgp_route.path):
+                    if len(r1.bgp_route.path) >= len(r2.bgp_route.path):
                         return False
                     else:
-                        to_remove = key
+                        to_remove = r2
                 elif r1.gw == r2.gw:
                     return False
+
         if to_remove:
-            with self.__routing_table_lock:
-                self.__routing_table.pop(to_remove)
+            self.__routing_table.remove(to_remove)
+            self.__forget(to_remove)
 
-        with self.__routing_table_lock:
-            self.__routing_table.append(r1)
+        self.__routing_table.add(r1)
+        if r1.source == 'B':
+            self.__dependents.setdefault(r1.adjacency[0] if r1.adjacency else None, set()).add(r1)
 
         return True
 
     def __drop_route(self, bgp_route):
-        with self.__routing_table_lock:
-            for i in range(len(self.__routing_table)):
-                r = self.__routing_table[i]
-                if r.source == 'B':
-                    if r.bgp_route and r.bgp_route == bgp_route:
-                        self.__routing_table.pop(i)
-                        return
-
-    def __send_withdraw_route(self, bgp_route):
+        for r in self.__routing_table.get(bgp_route.network, bgp_route.mask):
+            if r.source == 'B' and r.bgp_route == bgp_route:
+                self.__routing_table.remove(r)
+                self.__forget(r)
+                return True
+
+        return False
+
+    # installs the connected route of interface i, BGP routes whose next hop moves into it are resolved again
+    def __add_connected(self, i):
+        r = Route(i.ip, i.mask, '0.0.0.0', 'C', i.ip, 0, adjacency=(i, None))
+        self.__connected.add(r)
+        self.__add_route(r)
+
+        # the next hops which can change are the unresolved ones and those resolved through a shorter prefix,
+        # installed routes are shared with published snapshots, so each one is replaced by a new route
+        for interface in list(self.__dependents):
+            if interface is not None and ip_to_int(interface.mask) > r.mask:
+                continue
+
+            for old in [d for d in self.__dependents.get(interface, ()) if d.gw & r.mask == r.network]:
+                self.__routing_table.remove(old)
+                self.__forget(old)
+                self.__add_route(self.__bgp_fib_route(old.bgp_route))
+
+    # one reference assignment, lookups get either the old or the new table and never a half changed one
+    def __publish(self):
+        self.__fib = self.__routing_table.snapshot()
+
+    def __send_withdraw_routes(self, bgp_routes):
         for key, b in self.__bgp.items():
-            if b.state != 'ESTABLISHED' or b.neighbour_as == bgp_route.source:
+            if b.state != 'ESTABLISHED':
                 continue
 
-            b.withdraw_route(bgp_route)
+            b.withdraw_routes([r for r in bgp_routes if b.neighbour_as != r.source])
 
     def __drop_bgp_routes(self, bgp_as):
-        with self.__bgp_routing_table_lock:
-            to_del = []
-            for i in range(len(self.__bgp_routing_table)):
-                r = self.__bgp_routing_table[i]
+        with self.__bgp_routing_table_lock, self.__routing_table_lock:
+            for r in self.__bgp_routing_table.remove_source(bgp_as):
+                self.__drop_route(r)
+                self.__mark_dirty((r.network, r.mask))
+            self.__publish()
+
+    def __mark_dirty(self, key):
+        with self.__dirty_lock:
+            self.__dirty_prefixes.add(key)
+            runtime.notify_all(self.__dirty_lock)
+
+    # best path selection for the prefixes which changed since the last run,
+    # returns (old, new) best route pairs, new is None when the prefix is not reachable anymore
+    def __run_decision(self):
+        with self.__dirty_lock:
+            dirty = self.__dirty_prefixes
+            self.__dirty_prefixes = set()
+
+        changed = []
+        with self.__bgp_routing_table_lock, self.__routing_table_lock:
+            for key in dirty:
+                best = None
+                for r in self.__bgp_routing_table.get(key[0], key[1]):
+                    if not best or len(r.path) < len(best.path):
+                        best = r
+
+                old = self.__best_bgp_routes.get(key)
+                if best is old:
+                    continue
 
-                if r.source == bgp_as:
-                    to_del.append(i)
-                    self.__drop_route(r)
-                    self.__send_withdraw_route(r)
+                if old:
+                    self.__drop_route(old)
+
+                if best:
+                    self.__best_bgp_routes[key] = best
+                    self.__add_route(self.__bgp_fib_route(best))
+                else:
+                    del self.__best_bgp_routes[key]
+
+                changed.append((old, best))
 
-            del_from_list(self.__bgp_routing_table, to_del)
+            if changed:
+                self.__publish()
 
-    def __main_thread(self):
+        self.counters['best_path_changes'] += len(changed)
+        return changed
+
+    async def __main_thread(self):
         bgps_in_error_state = {}
         disabled_bgps = {}
+        synced_bgps = {}
         c = 0
+        next_check = runtime.time()
 
         while self.state:
-            c += 1
-            best_bgp_routes = self.__get_best_bgp_routes()
+            with self.__dirty_lock:
+                if not self.__dirty_prefixes:
+                    await runtime.wait(self.__dirty_lock, max(next_check - runtime.time(), 0))
+                dirty = len(self.__dirty_prefixes) > 0
+
+            if dirty:
+                # updates usually come in bursts, let the rest of the burst arrive and decide them together
+                await runtime.sleep(self.decision_delay)
+                changed = self.__run_decision()
+
+                new_routes = [best for old, best in changed if best]
+                for key, b in self.__bgp.items():
+                    if new_routes and b.state == 'ESTABLISHED' and synced_bgps.get(b.my_ip) == b.session_count:
+                        b.add_shared_routes(new_routes)
+
+                lost_routes = [old for old, best in changed if not best]
+                if lost_routes:
+                    self.__send_withdraw_routes(lost_routes)
+
+            if runtime.time() < next_check:
+                continue
 
-            for key, bgp_route in best_bgp_routes.items():
-                self.__add_route(Route(bgp_route.network, bgp_route.mask, bgp_route.next_hop, 'B', bgp_route=bgp_route))
+            next_check = runtime.time() + self.check_period
+            c += 1
 
             for key, b in self.__bgp.items():
                 if b.my_ip in disabled_bgps:
@@ -145,39 +255,51 @@ class Router:
                         }
 
                     if bgps_in_error_state[b.my_ip]['count'] < 2:
-                        debug_message(3, f"Router {self.name}", "main_thread",
-                                      f"BGP is in error state. IP {b.my_ip}, AS {b.neighbour_as}.")
-                        debug_message(3, f"Router {self.name}", "main_thread",
-                                      f"Restarting BGP instance. IP {b.my_ip}, AS {b.neighbour_as}.")
-                        b.off()
+                        self.__debug(3, "main_thread", "BGP is in error state. IP %s, AS %s.", b.my_ip, b.neighbour_as)
+                        self.__debug(3, "main_thread", "Restarting BGP instance. IP %s, AS %s.", b.my_ip, b.neighbour_as)
+                        await b.off()
                         b.on()
                     else:
-                        debug_message(3, f"Router {self.name}", "main_thread",
-                                      f"BGP is in error state for a long time. IP {b.my_ip}, AS {b.neighbour_as}.")
+                        self.__debug(3, "main_thread", "BGP is in error state for a long time. IP %s, AS %s.",
+                                     b.my_ip, b.neighbour_as)
                         disabled_bgps[b.my_ip] = b
                         self.__drop_bgp_routes(b.neighbour_as)
-                        debug_message(3, f"Router {self.name}", "main_thread",
-                                      f"Disabling BGP instance. IP {b.my_ip}, AS {b.neighbour_as}.")
+                        self.__debug(3, "main_thread", "Disabling BGP instance. IP %s, AS %s.",
+                                     b.my_ip, b.neighbour_as)
                 elif b.state == 'ESTABLISHED':
                     if b.my_ip in bgps_in_error_state:
                         bgps_in_error_state.pop(b.my_ip)
 
                     b.add_internal_routes(self.__propagated_bgp_networks)
-                    b.add_shared_routes(best_bgp_routes.values())
 
-            msg = ''
-            if len(self.__routing_table) and c % 2 == 0:
-                msg = f"Routing table: \n"
-                msg += f"AS   Source  Network  Mask Gateway   Interface AS-PATH\n"
-                for r in self.__routing_table:
-                    as_path = ''
-                    if r.bgp_route:
-                        as_path = ' '.join(map(str, r.bgp_route.path))
-                    msg += f"{self.as_id}   {r.source}  {int_to_ip(r.network)}  {int_to_ip(r.mask)} {int_to_ip(r.gw)}   {int_to_ip(r.interface)}    {as_path} \n"
+                    # a new session gets the whole table once, later only the changes
+                    if synced_bgps.get(b.my_ip) != b.session_count:
+                        with self.__bgp_routing_table_lock:
+                            best_bgp_routes = list(self.__best_bgp_routes.values())
+                        b.add_shared_routes(best_bgp_routes)
+                        synced_bgps[b.my_ip] = b.session_count
+
+            if len(self.__fib) and c % 2 == 0:
+                self.__debug(1, "main_thread", self.__format_routing_table)
+
+    def __format_routing_table(self):
+        msg = f"Routing table: \n"
+        msg += f"AS   Source  Network  Mask Gateway   Interface AS-PATH\n"
+        for r in self.get_routing_table():
+            as_path = ''
+            if r.bgp_route:
+                as_path = ' '.join(map(str, r.bgp_route.path))
+            msg += f"{self.as_id}   {r.source}  {int_to_ip(r.network)}  {int_to_ip(r.mask)} {int_to_ip(r.gw)}   {int_to_ip(r.interface)}    {as_path} \n"
 
-                debug_message(1, f"Router {self.name}", "main_thread", msg)
+        return msg
+
+    # message is a format string for args or a callable, nothing is formatted when the level is disabled
+    def __debug(self, severity, procedure, message, *args):
+        debug_message(severity, self.__debug_source, procedure, message, *args, key=self.name)
 
-            sleep(5)
+    # guards debug calls on the per packet and per prefix paths, where even building the arguments costs
+    def __debugging(self, severity):
+        return debug_enabled(severity, self.name)
 
     def __print_route(self, route):
         if route:
@@ -185,8 +307,15 @@ class Router:
 
     def __clear_storage(self):
         self.__sockets = {}
-        self.__routing_table = []
-        self.__bgp_routing_table = []
+        with self.__routing_table_lock:
+            self.__routing_table = Fib()
+            self.__connected = Fib()
+            self.__dependents = {}
+            self.__publish()
+        self.__bgp_routing_table = BGPTable()
+        self.__best_bgp_routes = {}
+        with self.__dirty_lock:
+            self.__dirty_prefixes = set()
 
     def add_bgp_network(self, network, mask):
         network = ip_to_int(network)
@@ -197,6 +326,12 @@ class Router:
         i.install(self)
         self.__interfaces[i.ip] = i
 
+        if self.state:
+            with self.__routing_table_lock:
+                self.__add_connected(i)
+                self.__publish()
+            i.on()
+
     def get_port(self, src_ip, src_port, sock):
         if src_ip not in self.__interfaces:
             return False
@@ -219,15 +354,92 @@ class Router:
                     del self.__sockets[src_ip][src_port]
 
     def add_bgp_route(self, network, mask, next_hop, as_path, source):
+        self.add_bgp_routes([(ip_to_int(network), ip_to_int(mask))], next_hop, as_path, source)
+
+    # prefixes is a list of (network, mask) as ints sharing the same next hop and path,
+    # every route of the update shares one PathAttributes
+    def add_bgp_routes(self, prefixes, next_hop, as_path, source):
+        attrs = attributes(as_path, ip_to_int(next_hop))
+
+        with self.__bgp_routing_table_lock:
+            for network, mask in prefixes:
+                r = BGPRoute.from_attributes(network, mask, attrs, source)
+                old = self.__bgp_routing_table.find(r.network, r.mask, r.source)
+
+                # repeated announcement, keep the route which is already in use
+                if old and old.attributes is attrs:
+                    continue
+
+                self.__bgp_routing_table.add(r)
+                self.__mark_dirty((r.network, r.mask))
+
+    # Bulk load of routes (network, mask, next_hop, path) as ints and a sequence of AS numbers, from source or,
+    # when source is None, from the first AS of every path. The tables are locked once per batch_size routes.
+    # Routes which are not advertised are used for forwarding only, the peers never hear about them.
+    # Returns the number of routes added.
+    def load_bgp_routes(self, routes, source=None, advertise=False, batch_size=10000):
+        count = 0
+        batch = []
+        for route in routes:
+            batch.append(route)
+            if len(batch) >= batch_size:
+                count += self.__load_batch(batch, source, advertise)
+                batch = []
+
+        if batch:
+            count += self.__load_batch(batch, source, advertise)
+
+        return count
+
+    def __load_batch(self, batch, source, advertise):
+        keys = []
         with self.__bgp_routing_table_lock:
-            self.__bgp_routing_table.append(
-                BGPRoute(network, mask, next_hop, ' '.join(map(str, as_path)), source=source))
+            table = self.__bgp_routing_table
+            for network, mask, next_hop, path in batch:
+                r = BGPRoute.from_ints(network, mask, next_hop, path, source, advertise)
+                old = table.find(r.network, r.mask, r.source)
+                if old and old.attributes is r.attributes:
+                    continue
+
+                table.add(r)
+                keys.append((r.network, r.mask))
+
+        with self.__dirty_lock:
+            self.__dirty_prefixes.update(keys)
+            runtime.notify_all(self.__dirty_lock)
+
+        return len(keys)
 
     def set_bgp(self, b):
         if b.my_ip in self.__interfaces:
             b.install(self)
             self.__bgp[b.my_ip] = b
 
+    # IP packet as scapy layers, the payload of a TCP segment is kept as Raw bytes for the socket to pass on,
+    # so BGP messages are not dissected here and scapy's own TCP bindings stay as they are
+    @staticmethod
+    def __dissect(data):
+        if data[9] != socket.IPPROTO_TCP:
+            return IP(data)
+
+        header_len = (data[0] & 0x0f) * 4
+        payload = header_len + (data[header_len + 12] >> 4) * 4
+        end = int.from_bytes(data[2:4], 'big')
+        if payload >= end:
+            return IP(data[:end])
+
+        return IP(data[:payload]) / Raw(data[payload:end])
+
+    # IP packet from an interface as bytes, only packets for this router are dissected,
+    # transit packets are forwarded as they are
+    def receive_packet(self, i, data):
+        if socket.inet_ntoa(data[16:20]) in self.__interfaces:
+            self.counters['packets_received'] += 1
+            self.receive_data(i, self.__dissect(data))
+        else:
+            self.counters['packets_forwarded'] += 1
+            self.send_data(data)
+
     def receive_data(self, i, packet):
         if packet.haslayer(IP):
             src_ip = packet[IP].src
@@ -235,8 +447,8 @@ class Router:
 
             if dst_ip not in self.__interfaces:
                 self.send_data(packet)
-                debug_message(5, f"Router {self.name}", "receive_data",
-                              f"Router got a packet to route, dst: {dst_ip}")
+                if self.__debugging(5):
+                    self.__debug(5, "receive_data", "Router got a packet to route, dst: %s", dst_ip)
             else:
                 if packet.haslayer(TCP):
                     dport = packet[TCP].dport
@@ -252,8 +464,9 @@ class Router:
                             answer = IP(src=packet[IP].dst, dst=packet[IP].src, ttl=20) / ICMP(type="echo-reply",
                                                                                                code=0)
                             self.send_data(answer)
-                            debug_message(5, f"Router {self.name}", "receive_data",
-                                          f"Router got ICMP request packet from {packet[IP].dst}, answering...")
+                            if self.__debugging(5):
+                                self.__debug(5, "receive_data", "Router got ICMP request packet from %s, answering...",
+                                             packet[IP].dst)
                         # response
                         elif icmp.type == 0:
                             with self.__ping_lock:
@@ -261,92 +474,121 @@ class Router:
                                     self.__ping_received = True
                                     self.__ping_data = packet
         else:
-            debug_message(5, f"Router {self.name}", "receive_data",
-                          f"Router received a packet without IP header.")
+            self.__debug(5, "receive_data", "Router received a packet without IP header.")
 
     def on(self):
         if self.state != 0:
             return
 
-        debug_message(5, f"Router {self.name}", "on", "Starting...")
+        self.__debug(5, "on", "Starting...")
         self.__clear_storage()
 
         self.state = 1
 
+        with self.__routing_table_lock:
+            for key, i in self.__interfaces.items():
+                self.__add_connected(i)
+            self.__publish()
+
         for key, i in self.__interfaces.items():
-            self.__routing_table.append(Route(i.ip, i.mask, '0.0.0.0', 'C', i.ip, 0))
             i.on()
 
-        debug_message(5, f"Router {self.name}", "on", "Interfaces started.")
+        self.__debug(5, "on", "Interfaces started.")
 
-        self.__th_main = threading.Thread(target=self.__main_thread)
-        self.__th_main.start()
+        self.__th_main = runtime.start(self.__main_thread)
 
-        debug_message(5, f"Router {self.name}", "on", "Main thread started.")
+        self.__debug(5, "on", "Main thread started.")
 
         for key, b in self.__bgp.items():
             b.on()
 
-        debug_message(5, f"Router {self.name}", "on", "BGP instances initialised.")
+        self.__debug(5, "on", "BGP instances initialised.")
 
     def receive_withdraw_route(self, network, mask, as_id):
-        debug_message(3, f"Router {self.name}", "receive_withdraw_route",
-                      f"Withdraw message received: {int_to_ip(network)}, {int_to_ip(mask)}, source: {as_id}")
-        with self.__bgp_routing_table_lock:
-            to_del = []
-            for i in range(len(self.__bgp_routing_table)):
-                r = self.__bgp_routing_table[i]
-                if r.network == network and r.mask == mask and r.source == as_id:
-                    to_del.append(i)
-
-            for i in to_del:
-                r = self.__bgp_routing_table[i]
-                self.__send_withdraw_route(r)
-                self.__drop_route(r)
-
-            del_from_list(self.__bgp_routing_table, to_del)
+        self.receive_withdraw_routes([(network, mask)], as_id)
+
+    def receive_withdraw_routes(self, prefixes, as_id):
+        debugging = self.__debugging(3)
+        with self.__bgp_routing_table_lock, self.__routing_table_lock:
+            for network, mask in prefixes:
+                if debugging:
+                    self.__debug(3, "receive_withdraw_route", "Withdraw message received: %s, %s, source: %s",
+                                 int_to_ip(network), int_to_ip(mask), as_id)
+
+                r = self.__bgp_routing_table.remove(network, mask, as_id)
+                if r:
+                    self.__drop_route(r)
+                    self.__mark_dirty((r.network, r.mask))
+            self.__publish()
 
+    # packet is an IP packet, as bytes or a scapy packet
     def send_data(self, packet):
-        route = self.__get_route(packet[IP].dst)
-        #self.__print_route(route)
-        if route:
-            if route.interface != 0:
-                self.__interfaces[int_to_ip(route.interface)].send_data(packet)
-            else:
-                route_to_gw = self.__get_route(route.gw)
-                if route_to_gw.interface != 0:
-                    self.__interfaces[int_to_ip(route_to_gw.interface)].send_data(packet, int_to_ip(route.gw))
-                else:
-                    debug_message(3, f"Router {self.name}", "send_data",
-                                  f"No route to host {packet.gw}")
+        if isinstance(packet, bytes):
+            dst = int.from_bytes(packet[16:20], 'big')
         else:
-            debug_message(3, f"Router {self.name}", "send_data",
-                          f"No route to host {packet.dst}")
+            dst = packet[IP].dst
 
-    def off(self):
+        route = self.__get_route(dst)
+        if route:
+            if route.adjacency:
+                interface, next_hop = route.adjacency
+                interface.send_data(packet, next_hop)
+            elif self.__debugging(3):
+                self.__debug(3, "send_data", "No route to host %s", int_to_ip(route.gw))
+        elif self.__debugging(3):
+            self.__debug(3, "send_data", "No route to host %s", int_to_ip(ip_to_int(dst)))
+
+    async def off(self):
         if self.state == 0:
             return
 
         self.state = 0
-        debug_message(5, f"Router {self.name}", "off", "Shutting down...")
+        self.__debug(5, "off", "Shutting down...")
+
+        # stop the main thread first so it does not restart the BGP instances being turned off
+        with self.__dirty_lock:
+            runtime.notify_all(self.__dirty_lock)
+        await runtime.join(self.__th_main)
 
         for key, b in self.__bgp.items():
-            b.off()
-        debug_message(5, f"Router {self.name}", "off", "BGP instances disabled.")
+            await b.off()
+        self.__debug(5, "off", "BGP instances disabled.")
 
         for key, i in self.__interfaces.items():
-            i.off()
+            await i.off()
 
-        debug_message(5, f"Router {self.name}", "off", "Interfaces disabled.")
+        self.__debug(5, "off", "Interfaces disabled.")
 
         self.__clear_storage()
 
-        debug_message(5, f"Router {self.name}", "off", "Router shut down.")
+        self.__debug(5, "off", "Router shut down.")
+
+    # BGP instance IP -> state
+    def get_bgp_states(self):
+        return {ip: b.state for ip, b in self.__bgp.items()}
+
+    # (network, mask) pairs this router announces
+    def get_bgp_networks(self):
+        return list(self.__propagated_bgp_networks)
+
+    # neighbour AS -> neighbour IP of every BGP instance
+    def get_bgp_neighbours(self):
+        return {b.neighbour_as: b.neighbour_ip for b in self.__bgp.values()}
+
+    # ({(network, mask): (routes)}, {(network, mask): best route}) at one moment,
+    # the router goes on changing its tables while they are read
+    def get_bgp_snapshot(self):
+        with self.__bgp_routing_table_lock:
+            return self.__bgp_routing_table.snapshot(), dict(self.__best_bgp_routes)
 
     def get_interfaces(self):
         return self.__interfaces.keys()
 
-    def ping(self, dst_ip, src_ip=None):
+    # the routes of the published routing table
+    def get_routing_table(self):
+        return list(self.__fib)
+
+    async def ping(self, dst_ip, src_ip=None):
         if len(self.__interfaces) == 0:
             return 'No interfaces'
 
@@ -360,12 +602,12 @@ class Router:
             packet = IP(src=src_ip, dst=dst_ip, ttl=20) / ICMP()
             self.send_data(packet)
 
-        debug_message(5, f"Router {self.name}", "ping", f"Sending ping from {src_ip} to {dst_ip}")
+        self.__debug(5, "ping", "Sending ping from %s to %s", src_ip, dst_ip)
 
         timeout = 10
         while timeout > 0 and not self.__ping_received:
             timeout -= 1
-            sleep(1)
+            await runtime.sleep(1)
 
         with self.__ping_lock:
             if self.__ping_received:
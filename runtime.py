@@ -0,0 +1,174 @@
+import asyncio
+import selectors
+
+import clock
+
+
+# Runs the main loops of wires, interfaces, sockets, BGP instances and routers.
+# The loops are coroutines which block only through the functions below, so the same code runs on either runtime:
+#   ThreadRuntime  - every loop gets its own thread, the coroutines never suspend and the calls map to clock,
+#                    virtual time is the clock's virtual mode
+#   AsyncioRuntime - every loop is a task on one event loop, no thread per object
+# Conditions are threading.Condition objects in both cases, they must never be held across an await other than wait().
+class ThreadRuntime:
+    name = 'threads'
+
+    def time(self):
+        return clock.time()
+
+    async def sleep(self, seconds):
+        clock.sleep(seconds)
+
+    async def wait(self, cond, timeout=None):
+        return clock.wait(cond, timeout)
+
+    def notify_all(self, cond):
+        clock.notify_all(cond)
+
+    # runs callback for a thread which is not part of the runtime
+    def call_threadsafe(self, callback, *args):
+        callback(*args)
+
+    def __step(self, coro):
+        try:
+            coro.send(None)
+        except StopIteration as e:
+            return e.value
+
+        coro.close()
+        raise RuntimeError('Coroutine suspended on the thread runtime, it may only block through runtime calls.')
+
+    def start(self, target, args=()):
+        return clock.start_thread(self.__step, (target(*args),))
+
+    async def join(self, task):
+        clock.join(task)
+
+    def run(self, coro):
+        return self.__step(coro)
+
+
+# selector which does not block: the time it would have slept for is skipped instead
+class _VirtualSelector(selectors.DefaultSelector):
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if not events and timeout:
+            self.now += timeout
+
+        return events
+
+
+class _VirtualEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        self.__selector = _VirtualSelector()
+        super().__init__(self.__selector)
+
+    def time(self):
+        return self.__selector.now
+
+
+class AsyncioRuntime:
+    name = 'asyncio'
+
+    def __init__(self, virtual=False):
+        self.virtual = virtual
+        self.__loop = _VirtualEventLoop() if virtual else asyncio.new_event_loop()
+        self.__cond_waiters = {}
+
+    def time(self):
+        return self.__loop.time()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    def __expire(self, fut):
+        if not fut.done():
+            fut.set_result(False)
+
+    # same as cond.wait(timeout), the caller must hold cond
+    async def wait(self, cond, timeout=None):
+        fut = self.__loop.create_future()
+        self.__cond_waiters.setdefault(cond, []).append(fut)
+
+        handle = None
+        if timeout is not None:
+            handle = self.__loop.call_later(max(timeout, 0), self.__expire, fut)
+
+        cond.release()
+        try:
+            return await fut
+        finally:
+            if handle:
+                handle.cancel()
+
+            waiters = self.__cond_waiters.get(cond)
+            if waiters and fut in waiters:
+                waiters.remove(fut)
+
+            cond.acquire()
+
+    def notify_all(self, cond):
+        for fut in self.__cond_waiters.pop(cond, ()):
+            if not fut.done():
+                fut.set_result(True)
+
+    def call_threadsafe(self, callback, *args):
+        self.__loop.call_soon_threadsafe(callback, *args)
+
+    def start(self, target, args=()):
+        return self.__loop.create_task(target(*args))
+
+    async def join(self, task):
+        await task
+
+    def run(self, coro):
+        return self.__loop.run_until_complete(coro)
+
+
+runtime = ThreadRuntime()
+
+
+def use_threads():
+    global runtime
+    runtime = ThreadRuntime()
+
+
+def use_asyncio(virtual=False):
+    global runtime
+    runtime = AsyncioRuntime(virtual)
+
+
+def time():
+    return runtime.time()
+
+
+async def sleep(seconds):
+    await runtime.sleep(seconds)
+
+
+async def wait(cond, timeout=None):
+    return await runtime.wait(cond, timeout)
+
+
+def notify_all(cond):
+    runtime.notify_all(cond)
+
+
+def call_threadsafe(callback, *args):
+    runtime.call_threadsafe(callback, *args)
+
+
+def start(target, args=()):
+    return runtime.start(target, args)
+
+
+async def join(task):
+    await runtime.join(task)
+
+
+def run(coro):
+    return runtime.run(coro)
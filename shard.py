@@ -0,0 +1,243 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import bgp
+import runtime
+import tools
+from shmwire import ShmWire
+from tools import debug_message, ETHER_BROADCAST_BYTES
+from wire import Wire
+
+
+# Wire with one end in this process and the other end in another shard.
+# Frames which are not for a mac attached here are sent to the inbound queue of the other shard,
+# frames from the other shard come back through receive().
+class ShardWire(Wire):
+    def __init__(self, link, remote_queue):
+        super().__init__()
+        self.link = link
+        self.remote_queue = remote_queue
+
+    def push(self, data):
+        if not super().push(data) or data[:6] == ETHER_BROADCAST_BYTES:
+            self.remote_queue.put((self.link, data))
+
+    def receive(self, frame):
+        self.deliver(frame)
+
+
+# splits the routers into n parts of neighbouring routers, so few links cross a partition boundary
+def partition(topology, n):
+    neighbours = topology.neighbours()
+    order = []
+    visited = set()
+
+    for root in sorted(neighbours):
+        if root in visited:
+            continue
+
+        visited.add(root)
+        queue = [root]
+        while queue:
+            as_id = queue.pop(0)
+            order.append(as_id)
+            for a in sorted(neighbours[as_id]):
+                if a not in visited:
+                    visited.add(a)
+                    queue.append(a)
+
+    n = max(1, min(n, len(order)))
+    size = -(-len(order) // n)
+
+    return [order[i:i + size] for i in range(0, len(order), size)]
+
+
+# shm_links maps the links between shards to shared memory segments, the other links go through the shard queues
+def shard_main(index, topology, as_ids, owners, queues, results, started, stop, runtime_name, codec, debug_level,
+               shm_links=None, debug_levels=None):
+    tools.debug_level = debug_level
+    tools.debug_levels = debug_levels or {}
+    if runtime_name == 'asyncio':
+        runtime.use_asyncio()
+    if codec:
+        bgp.default_codec = codec
+
+    # frames still queued for a shard which already stopped must not keep this process from exiting
+    for q in queues:
+        q.cancel_join_thread()
+
+    local = set(as_ids)
+    wires = {}
+
+    def remote_wire(link):
+        nlri1, nlri2, as1, as2 = topology.links[link]
+        if shm_links:
+            name, capacity = shm_links[link]
+            wires[link] = ShmWire(name, 0 if as1 in local else 1, capacity, create=False)
+        else:
+            remote = as2 if as1 in local else as1
+            wires[link] = ShardWire(link, queues[owners[remote]])
+        return wires[link]
+
+    routers = topology.build(as_ids, remote_wire)
+
+    def receive_thread():
+        while True:
+            item = queues[index].get()
+            if item is None:
+                break
+
+            link, frame = item
+            if link in wires:
+                runtime.call_threadsafe(wires[link].receive, frame)
+
+    threading.Thread(target=receive_thread, daemon=True).start()
+
+    async def run():
+        started.wait()
+        for r in routers.values():
+            r.on()
+
+        while not stop.is_set():
+            await runtime.sleep(0.1)
+
+        tables = {as_id: r.get_routing_table() for as_id, r in routers.items()}
+        for r in routers.values():
+            await r.off()
+
+        return tables
+
+    tables = runtime.run(run())
+    for w in wires.values():
+        if isinstance(w, ShmWire):
+            w.close()
+    queues[index].put(None)
+    # the process ends without running atexit handlers
+    tools.debug_flush()
+    results.put((index, tables))
+
+
+# Runs a topology split between several processes, one shard per process.
+# Links inside a shard stay in-memory wires. Links between shards become ShardWires, or ShmWires with the 'shm'
+# transport. Shards run on the real clock, a virtual clock can not be shared between processes.
+class Coordinator:
+    def __init__(self, topology, shards=None, runtime_name='threads', codec=None, transport='queue',
+                 shm_capacity=1 << 20):
+        self.topology = topology
+        self.partitions = partition(topology, shards or os.cpu_count() or 1)
+        self.runtime_name = runtime_name
+        self.codec = codec
+        self.transport = transport
+        self.shm_capacity = shm_capacity
+
+        self.__processes = []
+        self.__segments = []
+        self.__results = None
+        self.__stop = None
+
+    def start(self):
+        if self.__processes:
+            return
+
+        n = len(self.partitions)
+        owners = {as_id: i for i, part in enumerate(self.partitions) for as_id in part}
+        queues = [multiprocessing.Queue() for _ in range(n)]
+        started = multiprocessing.Barrier(n + 1)
+        self.__results = multiprocessing.Queue()
+        self.__stop = multiprocessing.Event()
+
+        shm_links = None
+        if self.transport == 'shm':
+            shm_links = {}
+            for link, (nlri1, nlri2, as1, as2) in enumerate(self.topology.links):
+                if owners[as1] != owners[as2]:
+                    segment = ShmWire(capacity=self.shm_capacity)
+                    self.__segments.append(segment)
+                    shm_links[link] = (segment.name, self.shm_capacity)
+
+        for i, part in enumerate(self.partitions):
+            p = multiprocessing.Process(target=shard_main,
+                                        args=(i, self.topology, part, owners, queues, self.__results, started,
+                                              self.__stop, self.runtime_name, self.codec, tools.debug_level,
+                                              shm_links, tools.debug_levels),
+                                        daemon=True)
+            p.start()
+            self.__processes.append(p)
+
+        # a shard which fails before it is ready would keep everyone else waiting at the barrier forever
+        ready = threading.Event()
+
+        def watch():
+            while not ready.wait(1):
+                if not all(p.is_alive() for p in self.__processes):
+                    started.abort()
+                    return
+
+        threading.Thread(target=watch, daemon=True).start()
+        try:
+            started.wait()
+        except threading.BrokenBarrierError:
+            failed = [(i, p.exitcode) for i, p in enumerate(self.__processes) if not p.is_alive()]
+            self.__shutdown()
+            raise RuntimeError(', '.join(f'shard {i} exited with code {code}' for i, code in failed) +
+                               ' before it was ready')
+        finally:
+            ready.set()
+
+        debug_message(4, "Coordinator", "start", "%s shards started, %s routers.", n, len(owners))
+
+    # stops every shard, returns {as_id: routes} with the routing tables the routers had when they were stopped
+    def stop(self):
+        if not self.__processes:
+            return {}
+
+        self.__stop.set()
+
+        tables = {}
+        pending = dict(enumerate(self.__processes))
+        exited = set()
+        while pending:
+            try:
+                index, shard_tables = self.__results.get(timeout=1)
+            except queue.Empty:
+                # a shard which exited without sending its tables failed, it gets one more poll for a result
+                # which was still on its way through the pipe
+                failed = sorted(exited & pending.keys())
+                if failed:
+                    self.__shutdown()
+                    raise RuntimeError(', '.join(f'shard {i} exited with code {pending[i].exitcode}' for i in failed) +
+                                       ' without sending its routing tables')
+
+                exited = {i for i, p in pending.items() if not p.is_alive()}
+                continue
+
+            tables.update(shard_tables)
+            del pending[index]
+
+        self.__shutdown()
+
+        debug_message(4, "Coordinator", "stop", "Shards stopped, %s routing tables collected.", len(tables))
+
+        return tables
+
+    # ends the shards which still run and frees the shared memory
+    def __shutdown(self):
+        for p in self.__processes:
+            if p.is_alive():
+                p.join(1)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        self.__processes = []
+
+        for segment in self.__segments:
+            segment.close()
+        self.__segments = []
+
+    def run(self, time_to_run):
+        self.start()
+        time.sleep(time_to_run)
+        return self.stop()
@@ -0,0 +1,176 @@
+import struct
+import threading
+from multiprocessing.shared_memory import SharedMemory
+
+import runtime
+from tools import ETHER_BROADCAST_BYTES, mac_to_bytes
+from wire import Wire
+
+COUNTER = struct.Struct('Q')
+LENGTH = struct.Struct('I')
+RING_HEADER = 64
+WRAP = 0xffffffff
+
+
+# Single producer, single consumer ring of length prefixed frames in a shared memory buffer.
+# The producer only moves tail and the consumer only moves head, both are byte counters which never wrap,
+# so neither side needs a lock. A frame never wraps around the end of the buffer, the producer skips
+# to the start instead and marks the skipped space with WRAP when there is room for a length.
+class RingBuffer:
+    def __init__(self, buf, offset, capacity):
+        self.buf = buf
+        self.capacity = capacity
+        self.__head = offset
+        self.__tail = offset + COUNTER.size
+        self.__data = offset + RING_HEADER
+
+    def __len__(self):
+        return COUNTER.unpack_from(self.buf, self.__tail)[0] - COUNTER.unpack_from(self.buf, self.__head)[0]
+
+    # returns False when there is no room for the frame, nothing is written then
+    def write(self, frame):
+        need = LENGTH.size + len(frame)
+        head = COUNTER.unpack_from(self.buf, self.__head)[0]
+        tail = COUNTER.unpack_from(self.buf, self.__tail)[0]
+
+        pos = tail % self.capacity
+        skip = 0
+        if pos + need > self.capacity:
+            skip = self.capacity - pos
+
+        if tail + skip + need - head > self.capacity:
+            return False
+
+        if skip:
+            if skip >= LENGTH.size:
+                LENGTH.pack_into(self.buf, self.__data + pos, WRAP)
+            pos = 0
+
+        start = self.__data + pos
+        LENGTH.pack_into(self.buf, start, len(frame))
+        self.buf[start + LENGTH.size:start + need] = frame
+
+        # the frame is in place before the consumer can see it
+        COUNTER.pack_into(self.buf, self.__tail, tail + skip + need)
+        return True
+
+    # returns the oldest frame as bytes or None when the ring is empty
+    def read(self):
+        head = COUNTER.unpack_from(self.buf, self.__head)[0]
+        tail = COUNTER.unpack_from(self.buf, self.__tail)[0]
+        if head == tail:
+            return None
+
+        pos = head % self.capacity
+        if self.capacity - pos < LENGTH.size or LENGTH.unpack_from(self.buf, self.__data + pos)[0] == WRAP:
+            head += self.capacity - pos
+            pos = 0
+
+        start = self.__data + pos
+        size = LENGTH.unpack_from(self.buf, start)[0]
+        frame = bytes(self.buf[start + LENGTH.size:start + LENGTH.size + size])
+
+        COUNTER.pack_into(self.buf, self.__head, head + LENGTH.size + size)
+        return frame
+
+
+# Wire between two processes over a shared memory segment with one ring per direction.
+# Each process opens the wire by name with its own side, 0 or 1, and attaches its interfaces as usual.
+# Frames for a mac attached on this side stay in the local queues, everything else goes to the other side.
+# There is no signal between the processes, pop() polls the incoming ring with a growing interval.
+# Nothing is locked between the processes, the local locks only keep threads of the same side from
+# writing or draining a ring at the same time.
+class ShmWire(Wire):
+    def __init__(self, name=None, side=0, capacity=1 << 20, create=True, capture=None):
+        super().__init__(capture)
+
+        size = 2 * (RING_HEADER + capacity)
+        if create:
+            self.shm = SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = SharedMemory(name=name)
+
+        self.name = self.shm.name
+        self.side = side
+        self.capacity = capacity
+        self.dropped = 0
+        # seconds between two looks at the incoming ring while it stays empty. The interval doubles up to max_poll,
+        # so the first frame after an idle spell waits up to max_poll before it is seen. A lower max_poll cuts
+        # that latency and costs more wake-ups of idle pops.
+        self.min_poll = 0.0001
+        self.max_poll = 0.01
+
+        rings = [RingBuffer(self.shm.buf, 0, capacity), RingBuffer(self.shm.buf, RING_HEADER + capacity, capacity)]
+        self.__tx = rings[side]
+        self.__rx = rings[1 - side]
+        self.__tx_lock = threading.Lock()
+        self.__rx_lock = threading.Lock()
+        self.__owner = create
+        self.__woken = set()
+
+        self.counters['frames_dropped'] = 0
+        self.counters.gauges['ring_bytes'] = lambda: len(self.__rx)
+        self.counters.labels['shm'] = self.name
+
+    def push(self, data):
+        if not super().push(data) or data[:6] == ETHER_BROADCAST_BYTES:
+            # the ring takes one producer, but every interface thread on this side (forwarding, BGP sockets, ARP)
+            # pushes here. The lock is not shared with the other process and is rarely contended, handing each
+            # frame to a single producer thread would cost a queue and a thread switch per frame instead.
+            with self.__tx_lock:
+                written = self.__tx.write(data)
+            if not written:
+                self.dropped += 1
+                self.counters['frames_dropped'] += 1
+
+    # another thread already draining the ring delivers the frames for this one too
+    def __drain(self):
+        if not self.__rx_lock.acquire(False):
+            return
+
+        try:
+            while True:
+                frame = self.__rx.read()
+                if frame is None:
+                    break
+
+                self.deliver(frame)
+        finally:
+            self.__rx_lock.release()
+
+    async def pop(self, mac, timeout=0):
+        if isinstance(mac, str):
+            mac = mac_to_bytes(mac)
+
+        deadline = None if timeout is None else runtime.time() + timeout
+        poll = self.min_poll
+
+        while True:
+            self.__drain()
+            data = await super().pop(mac, 0)
+            if data or mac in self.__woken:
+                self.__woken.discard(mac)
+                return data
+
+            if deadline is None:
+                wait_time = poll
+            else:
+                wait_time = min(poll, deadline - runtime.time())
+                if wait_time <= 0:
+                    return None
+
+            await runtime.sleep(wait_time)
+            poll = min(poll * 2, self.max_poll)
+
+    def wake(self, mac):
+        if isinstance(mac, str):
+            mac = mac_to_bytes(mac)
+        self.__woken.add(mac)
+        super().wake(mac)
+
+    # only the side which created the segment removes it
+    def close(self):
+        self.__tx = self.__rx = None
+        self.shm.close()
+        if self.__owner:
+            self.shm.unlink()
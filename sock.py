@@ -1,8 +1,9 @@
 from scapy.layers.inet import IP, ICMP, Ether, TCP
-from time import sleep
 from random import randint
 import threading
+from collections import deque
 
+import runtime
 from tools import debug_message, craft_tcp
 
 
@@ -21,8 +22,9 @@ class Sock:
 
         self.__router = router
 
-        self.__container = []
-        self.__data_lock = threading.Lock()
+        self.__container = deque()
+        # signalled on incoming data and on every state change
+        self.__data_lock = threading.Condition(threading.Lock())
 
         self.__port_acquired = False
 
@@ -34,17 +36,49 @@ class Sock:
         if self.sport == 0:
             self.sport = randint(49152, 65535)
 
-    # read data
-    def recv(self, size = 0):
+    # read data, blocks until data arrives, the socket is closed or timeout seconds pass (None waits forever)
+    async def recv(self, size = 0, timeout=None):
         data = None
+        deadline = None if timeout is None else runtime.time() + timeout
 
-        while self.state != 'IDLE':
-            with self.__data_lock:
-                if len(self.__container) > 0:
-                    data = self.__container.pop(0)
+        with self.__data_lock:
+            while self.state != 'IDLE':
+                if self.__container:
+                    data = self.__container.popleft()
                     break
+
+                if deadline is None:
+                    await runtime.wait(self.__data_lock)
+                else:
+                    remaining = deadline - runtime.time()
+                    if remaining <= 0:
+                        break
+
+                    await runtime.wait(self.__data_lock, remaining)
         return data
 
+    def __set_state(self, state):
+        with self.__data_lock:
+            self.state = state
+            runtime.notify_all(self.__data_lock)
+
+    # blocks until the socket gets to one of states or timeout seconds pass, returns the current state
+    async def __wait_state(self, states, timeout=None):
+        deadline = None if timeout is None else runtime.time() + timeout
+
+        with self.__data_lock:
+            while self.state not in states:
+                if deadline is None:
+                    await runtime.wait(self.__data_lock)
+                else:
+                    remaining = deadline - runtime.time()
+                    if remaining <= 0:
+                        break
+
+                    await runtime.wait(self.__data_lock, remaining)
+
+            return self.state
+
     # send data
     def sendall(self, data):
         packet = craft_tcp(self.src_ip, self.dst_ip, self.sport, self.dport, self.seq_num, self.ack_num, '')
@@ -64,23 +98,22 @@ class Sock:
 
         return b_port
 
-    def accept(self):
+    # returns as soon as the handshake completes, timeout in seconds (None waits forever)
+    async def accept(self, timeout=None):
         if self.state != 'LISTEN':
             return False
 
-        while self.state != 'ESTABLISHED' and self.state != 'IDLE':
-            sleep(0.1)
-
-        if self.state == 'ESTABLISHED':
+        if await self.__wait_state(('ESTABLISHED', 'IDLE'), timeout) == 'ESTABLISHED':
             return self, (self.dst_ip, self.dport)
 
         return None, None
 
-    def connect(self, dst, timeout=5):
+    # SYN is sent again every retransmit seconds, nothing answers a SYN to a port nobody listens on yet
+    async def connect(self, dst, timeout=5, retransmit=0.5):
         if self.state != 'IDLE':
             return False
 
-        if timeout < 1 or timeout > 120:
+        if timeout <= 0 or timeout > 120:
             timeout = 5
 
         self.dst_ip = dst[0]
@@ -91,16 +124,22 @@ class Sock:
             self.seq_num = randint(1, (2 ^ 32) - 1)
 
             packet_syn = craft_tcp(self.src_ip, self.dst_ip, self.sport, self.dport, self.seq_num, 0, 'S')
-            self.__router.send_data(packet_syn)
             self.seq_num += 1
-            self.state = 'SYN-SENT'
+            self.__set_state('SYN-SENT')
+            self.__router.send_data(packet_syn)
 
-            while timeout > 0:
-                timeout -= 1
-                if self.state == 'ESTABLISHED':
+            deadline = runtime.time() + timeout
+            while True:
+                wait_time = min(retransmit, deadline - runtime.time())
+                state = await self.__wait_state(('ESTABLISHED', 'IDLE'), wait_time)
+                if state == 'ESTABLISHED':
                     return True
 
-                sleep(1)
+                if state == 'IDLE' or runtime.time() >= deadline:
+                    break
+
+                if state == 'SYN-SENT':
+                    self.__router.send_data(packet_syn)
 
             self.close()
 
@@ -112,7 +151,7 @@ class Sock:
             packet_rst = craft_tcp(self.src_ip, self.dst_ip, self.sport, self.dport, self.seq_num, 0, 'R')
             self.__router.send_data(packet_rst)
 
-        self.state = 'IDLE'
+        self.__set_state('IDLE')
 
         if self.__port_acquired:
             self.__router.release_port(self.src_ip, self.sport, self)
@@ -132,10 +171,13 @@ class Sock:
                 if packet[IP].src == self.dst_ip and \
                         packet[TCP].sport == self.dport:
                         #and packet[TCP].ack == self.seq_num:
+                    # the payload as bytes, the reader decodes it
+                    payload = bytes(packet[TCP].payload)
                     with self.__data_lock:
-                        self.__container.append(packet[TCP].payload)
+                        self.__container.append(payload)
                         # change ack
-                        self.ack_num += len(packet[TCP].payload)
+                        self.ack_num += len(payload)
+                        runtime.notify_all(self.__data_lock)
 
         if self.state == 'LISTEN':
             if packet[TCP].flags == 'S':
@@ -147,13 +189,13 @@ class Sock:
                 packet_syn_ack = craft_tcp(self.src_ip, self.dst_ip, self.sport, self.dport, self.seq_num, self.ack_num, 'SA')
                 self.__router.send_data(packet_syn_ack)
                 self.seq_num += 1
-                self.state = 'SYN-RECEIVED'
+                self.__set_state('SYN-RECEIVED')
         elif self.state == 'SYN-RECEIVED':
             if packet[TCP].flags == 'A':
                 if packet[IP].src == self.dst_ip and \
                         packet[TCP].sport == self.dport and \
                         packet[TCP].ack == self.seq_num:
-                    self.state = 'ESTABLISHED'
+                    self.__set_state('ESTABLISHED')
         elif self.state == 'SYN-SENT':
             if packet[TCP].flags == 'SA':
                 if packet[IP].src == self.dst_ip and \
@@ -163,7 +205,7 @@ class Sock:
                     packet_ack = craft_tcp(self.src_ip, self.dst_ip, self.sport, self.dport, self.seq_num,
                                                 self.ack_num, 'A')
                     self.__router.send_data(packet_ack)
-                    self.state = 'ESTABLISHED'
+                    self.__set_state('ESTABLISHED')
                 else:
                     packet_rst = craft_tcp(self.src_ip, self.dst_ip, self.sport, self.dport, self.seq_num, 0, 'R')
                     self.__router.send_data(packet_rst)
@@ -0,0 +1,152 @@
+import itertools
+import json
+import os
+import threading
+import weakref
+
+import runtime
+from tools import debug_message
+
+
+# Counters of one object, a dict of name -> number which the object increments itself.
+# Increments are plain dict updates without a lock, two threads may rarely lose one between them,
+# which is the price of keeping the counters on all the time.
+# Gauges are read when the counters are collected, name -> callable returning the current value.
+class Counters(dict):
+    def __init__(self, kind, names, gauges=None, **labels):
+        super().__init__(dict.fromkeys(names, 0))
+        self.kind = kind
+        self.labels = labels
+        self.gauges = gauges or {}
+
+        _registry[next(_ids)] = self
+
+
+# counters are dicts which can not be put in a WeakSet, they are kept by a sequence number
+_registry = weakref.WeakValueDictionary()
+_ids = itertools.count()
+
+
+# [(kind, labels, counters, gauges)] for every object alive in this process, sorted by kind and labels
+def collect():
+    result = []
+    for ref in _registry.valuerefs():
+        c = ref()
+        if c is None:
+            continue
+
+        gauges = {}
+        for name, gauge in c.gauges.items():
+            try:
+                gauges[name] = gauge()
+            except Exception:
+                continue
+        result.append((c.kind, dict(c.labels), dict(c), gauges))
+
+    result.sort(key=lambda r: (r[0], sorted(r[1].items())))
+    return result
+
+
+def _prometheus_labels(labels):
+    return ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+
+
+# text exposition format, counters get the _total suffix
+def to_prometheus(records, prefix='bgpsim'):
+    metrics = {}
+    for kind, labels, counters, gauges in records:
+        labels = _prometheus_labels(labels)
+        for name, value in counters.items():
+            metrics.setdefault((f'{prefix}_{kind}_{name}_total', 'counter'), []).append((labels, value))
+        for name, value in gauges.items():
+            metrics.setdefault((f'{prefix}_{kind}_{name}', 'gauge'), []).append((labels, value))
+
+    lines = []
+    for (metric, metric_type), samples in metrics.items():
+        lines.append(f'# TYPE {metric} {metric_type}')
+        lines.extend(f'{metric}{{{labels}}} {value}' for labels, value in samples)
+
+    return '\n'.join(lines) + '\n'
+
+
+# one JSON object per line and object
+def to_json_lines(records, timestamp=None):
+    return ''.join(json.dumps({'time': timestamp, 'kind': kind, 'labels': labels,
+                               'counters': counters, 'gauges': gauges}) + '\n'
+                   for kind, labels, counters, gauges in records)
+
+
+# Writes the counters of this process to a file every period seconds (real time) and once more when stopped.
+# 'prometheus' replaces the file with the current values, for a textfile collector,
+# 'json' appends one line per object with the simulation time.
+class Exporter:
+    def __init__(self, filename, fmt='prometheus', period=10):
+        if fmt not in ('prometheus', 'json'):
+            raise ValueError(f'Unknown counters format {fmt}')
+
+        self.filename = filename
+        self.fmt = fmt
+        self.period = period
+        self.written = 0
+
+        self.__th_main = None
+        self.__stop = threading.Event()
+        self.state = 0
+
+    def dump(self):
+        records = collect()
+        if self.fmt == 'prometheus':
+            tmp = self.filename + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(to_prometheus(records))
+            os.replace(tmp, self.filename)
+        else:
+            with open(self.filename, 'a') as f:
+                f.write(to_json_lines(records, round(runtime.time(), 3)))
+
+        self.written += 1
+
+    def __main_thread(self):
+        while not self.__stop.wait(self.period):
+            self.dump()
+
+        self.dump()
+
+    def start(self):
+        if self.state:
+            return
+
+        self.state = 1
+        self.__stop.clear()
+        self.__th_main = threading.Thread(target=self.__main_thread, daemon=True)
+        self.__th_main.start()
+
+    def stop(self):
+        if not self.state:
+            return
+
+        self.state = 0
+        self.__stop.set()
+        self.__th_main.join()
+        debug_message(4, "Exporter", "stop", "Counters written to %s %s times.", self.filename, self.written)
+
+
+default_exporter = None
+
+
+def start_export(filename, **kwargs):
+    global default_exporter
+
+    stop_export()
+    default_exporter = Exporter(filename, **kwargs)
+    default_exporter.start()
+
+    return default_exporter
+
+
+def stop_export():
+    global default_exporter
+
+    if default_exporter:
+        default_exporter.stop()
+        default_exporter = None
@@ -0,0 +1,6 @@
+from tools import nlri_to_prefixes
+
+
+# 'a.b.c.d/len' as the (network, mask) ints the tables key routes by
+def prefix(cidr):
+    return nlri_to_prefixes([cidr])[0]
@@ -0,0 +1,89 @@
+import random
+
+from scapy.compat import raw
+from scapy.contrib.bgp import BGPHeader, BGPKeepAlive, BGPOpen, BGPPAAS4BytesPath, BGPUpdate, bgp_module_conf
+
+import bgpcodec
+from tools import NETMASKS, craft_bgp_updates, craft_bgp_withdraws, ip_to_int, prefix_to_nlri
+
+MARKER = 0xffffffffffffffffffffffffffffffff
+
+
+def random_prefixes(n, seed=0):
+    rng = random.Random(seed)
+    prefixes = set()
+    while len(prefixes) < n:
+        mask = NETMASKS[rng.randint(8, 32)]
+        prefixes.add((rng.getrandbits(32) & mask, mask))
+
+    return sorted(prefixes)
+
+
+def scapy_messages(updates):
+    return [raw(BGPHeader(type=2, marker=MARKER) / u) for u in updates]
+
+
+def test_update_round_trip():
+    prefixes = random_prefixes(50)
+    withdrawn = random_prefixes(10, seed=1)
+    data = bgpcodec.encode_update(withdrawn, [501, 502, 4200000000], ip_to_int('172.16.1.1'), prefixes)
+
+    msg, = bgpcodec.decode(data)
+    assert isinstance(msg, bgpcodec.Update)
+    assert msg.withdrawn == withdrawn
+    assert msg.nlri == prefixes
+    assert msg.as_path == [501, 502, 4200000000]
+    assert msg.next_hop == ip_to_int('172.16.1.1')
+    assert (msg.origin, msg.med, msg.local_pref) == (bgpcodec.ORIGIN_IGP, 0, 100)
+
+
+def test_updates_match_scapy():
+    prefixes = random_prefixes(1500)
+    nlris = [prefix_to_nlri(p) for p in prefixes]
+
+    native = bgpcodec.encode_updates([501, 502], ip_to_int('172.16.1.1'), prefixes)
+    crafted = scapy_messages(craft_bgp_updates('IGP', [501, 502], '172.16.1.1', nlris))
+
+    assert len(native) > 1
+    assert native == crafted
+    assert all(len(m) <= bgpcodec.MAX_MESSAGE_LEN for m in native)
+
+
+def test_withdraws_match_scapy():
+    prefixes = random_prefixes(1500, seed=2)
+
+    native = bgpcodec.encode_withdraws(prefixes)
+    crafted = scapy_messages(craft_bgp_withdraws([prefix_to_nlri(p) for p in prefixes]))
+
+    assert native == crafted
+    assert [p for m in native for msg in bgpcodec.decode(m) for p in msg.withdrawn] == prefixes
+
+
+def test_open_and_keepalive_match_scapy():
+    crafted = raw(BGPHeader(type=1, marker=MARKER) / BGPOpen(my_as=501, hold_time=30, bgp_id='10.0.0.1'))
+
+    assert bgpcodec.encode_open(501, 30, '10.0.0.1') == crafted
+    assert bgpcodec.encode_keepalive() == raw(BGPKeepAlive())
+
+
+def test_decodes_scapy_messages_back_to_back():
+    data = (raw(BGPHeader(type=1, marker=MARKER) / BGPOpen(my_as=501, hold_time=30, bgp_id='10.0.0.1')) +
+            raw(BGPKeepAlive()) +
+            scapy_messages(craft_bgp_updates('IGP', [501], '172.16.1.1', ['10.0.0.0/8']))[0])
+
+    open_msg, keepalive, update = bgpcodec.decode(data)
+    assert (open_msg.my_as, open_msg.hold_time, open_msg.bgp_id) == (501, 30, '10.0.0.1')
+    assert isinstance(keepalive, bgpcodec.KeepAlive)
+    assert update.nlri == [(ip_to_int('10.0.0.0'), NETMASKS[8])]
+    assert update.as_path == [501]
+
+
+def test_scapy_dissects_native_updates(monkeypatch):
+    # what bgp.setup_scapy_codec() does, without changing the scapy configuration for the other tests
+    monkeypatch.setattr(bgp_module_conf, 'use_2_bytes_asn', False)
+    data = bgpcodec.encode_update(as_path=[501, 4200000000], next_hop=ip_to_int('172.16.1.1'),
+                                  nlri=[(ip_to_int('10.1.0.0'), NETMASKS[16])])
+
+    update = BGPHeader(data).getlayer(BGPUpdate)
+    assert [a for s in update.getlayer(BGPPAAS4BytesPath).segments for a in s.segment_value] == [501, 4200000000]
+    assert [n.prefix for n in update.nlri] == ['10.1.0.0/16']
@@ -0,0 +1,47 @@
+from bgproute import BGPRoute
+from bgptable import BGPTable
+
+from helpers import prefix
+
+
+def test_table_snapshot_is_not_changed():
+    network, mask = prefix('10.0.0.0/8')
+    other = prefix('192.0.2.0/24')
+    first = BGPRoute.from_ints(network, mask, 1, (65001,))
+    second = BGPRoute.from_ints(*other, 1, (65001,))
+    table = BGPTable()
+    table.add(first)
+    table.add(second)
+
+    snapshot = table.snapshot()
+    table.add(BGPRoute.from_ints(network, mask, 2, (65002,)))
+    replaced = table.add(BGPRoute.from_ints(network, mask, 3, (65001, 65003)))
+    table.remove(*other, 65001)
+    table.add(BGPRoute.from_ints(*prefix('198.51.100.0/24'), 1, (65001,)))
+
+    assert replaced is first
+    assert snapshot == {(network, mask): (first,), other: (second,)}
+    assert sorted(r.next_hop for r in table.get(network, mask)) == [2, 3]
+    assert len(table) == 3
+
+    later = table.snapshot()
+    table.remove_source(65001)
+    assert len(later[(network, mask)]) == 2
+    assert [r.source for r in table] == [65002]
+
+
+def test_len_counts_routes():
+    network, mask = prefix('10.0.0.0/8')
+    table = BGPTable()
+    table.add(BGPRoute.from_ints(network, mask, 1, (65001,)))
+    table.add(BGPRoute.from_ints(network, mask, 2, (65001, 65003)))
+    table.add(BGPRoute.from_ints(network, mask, 1, (65002,)))
+    table.add(BGPRoute.from_ints(*prefix('192.0.2.0/24'), 1, (65001,)))
+    assert len(table) == 3
+
+    assert table.remove(network, mask, 65002)
+    assert table.remove(network, mask, 65002) is None
+    assert len(table) == 2
+
+    assert len(table.remove_source(65001)) == 2
+    assert len(table) == 0
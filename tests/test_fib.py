@@ -0,0 +1,142 @@
+import random
+
+from fib import Fib, PREFIX_MASKS
+from route import Route
+from tools import ip_to_int, int_to_ip, netmask_to_bits
+
+
+def route(prefix, gw='192.0.2.1', metric=0):
+    network, bits = prefix.split('/')
+    return Route(network, PREFIX_MASKS[int(bits)], gw, 'B', metric=metric)
+
+
+def prefix_of(r):
+    return r.network, r.mask
+
+
+def test_longest_prefix_match():
+    fib = Fib()
+    for prefix in ['0.0.0.0/0', '10.0.0.0/8', '10.1.0.0/16', '10.1.2.0/24', '10.1.2.3/32', '192.168.0.0/16']:
+        fib.add(route(prefix))
+
+    def match(ip):
+        r = fib.lookup(ip_to_int(ip))
+        return f'{int_to_ip(r.network)}/{netmask_to_bits(r.mask)}' if r else None
+
+    assert match('10.1.2.3') == '10.1.2.3/32'
+    assert match('10.1.2.4') == '10.1.2.0/24'
+    assert match('10.1.3.1') == '10.1.0.0/16'
+    assert match('10.2.0.1') == '10.0.0.0/8'
+    assert match('192.168.5.5') == '192.168.0.0/16'
+    assert match('172.16.0.1') == '0.0.0.0/0'
+    assert len(fib) == 6
+
+
+def test_no_match():
+    fib = Fib()
+    assert fib.lookup(ip_to_int('10.0.0.1')) is None
+
+    fib.add(route('10.0.0.0/8'))
+    assert fib.lookup(ip_to_int('11.0.0.1')) is None
+
+
+def test_lowest_metric_wins_within_a_prefix():
+    fib = Fib()
+    fib.add(route('10.0.0.0/8', '192.0.2.1', metric=5))
+    fib.add(route('10.0.0.0/8', '192.0.2.2', metric=1))
+
+    assert fib.lookup(ip_to_int('10.0.0.1')).gw == ip_to_int('192.0.2.2')
+    assert len(fib.get(ip_to_int('10.0.0.0'), PREFIX_MASKS[8])) == 2
+
+
+def test_remove_falls_back_to_shorter_prefix():
+    fib = Fib()
+    short = route('10.0.0.0/8')
+    sibling = route('10.1.0.0/16')
+    long = route('10.2.0.0/16')
+    for r in (short, sibling, long):
+        fib.add(r)
+
+    assert fib.remove(long)
+    assert not fib.remove(long)
+    assert prefix_of(fib.lookup(ip_to_int('10.2.0.1'))) == prefix_of(short)
+    assert prefix_of(fib.lookup(ip_to_int('10.1.0.1'))) == prefix_of(sibling)
+
+    assert fib.remove(short)
+    assert fib.lookup(ip_to_int('10.2.0.1')) is None
+    assert [prefix_of(r) for r in fib] == [prefix_of(sibling)]
+
+
+def test_matches_linear_scan():
+    rng = random.Random(1)
+    fib = Fib()
+    routes = []
+    for step in range(3000):
+        if routes and rng.random() < 0.4:
+            r = routes.pop(rng.randrange(len(routes)))
+            assert fib.remove(r)
+        else:
+            bits = rng.choice([0, 8, 12, 16, 20, 24, 24, 28, 32])
+            r = Route(rng.getrandbits(32), PREFIX_MASKS[bits], rng.getrandbits(32), 'B')
+            fib.add(r)
+            routes.append(r)
+
+    assert len(fib) == len(routes)
+    assert sorted(map(prefix_of, fib)) == sorted(map(prefix_of, routes))
+
+    for _ in range(2000):
+        ip = rng.getrandbits(32) if rng.random() < 0.5 else rng.choice(routes).network | rng.getrandbits(4)
+        matching = [r for r in routes if ip & r.mask == r.network]
+        found = fib.lookup(ip)
+        if not matching:
+            assert found is None
+        else:
+            assert found.mask == max(r.mask for r in matching)
+
+
+def test_snapshot_is_not_changed():
+    fib = Fib()
+    kept = route('10.0.0.0/8')
+    removed = route('10.1.0.0/16')
+    for r in (kept, removed, route('10.1.2.0/24')):
+        fib.add(r)
+
+    snapshot = fib.snapshot()
+    before = sorted(map(prefix_of, snapshot))
+
+    fib.remove(removed)
+    fib.add(route('10.1.2.128/25'))
+    fib.add(route('10.1.0.0/16', '192.0.2.9'))
+    fib.add(route('172.16.0.0/12'))
+
+    assert sorted(map(prefix_of, snapshot)) == before
+    assert len(snapshot) == 3
+    assert snapshot.lookup(ip_to_int('10.1.0.1')) is removed
+    assert snapshot.lookup(ip_to_int('10.1.2.200')).mask == PREFIX_MASKS[24]
+    assert snapshot.lookup(ip_to_int('172.16.0.1')) is None
+
+    assert fib.lookup(ip_to_int('10.1.0.1')).gw == ip_to_int('192.0.2.9')
+    assert fib.lookup(ip_to_int('10.1.2.200')).mask == PREFIX_MASKS[25]
+    assert len(fib) == 5
+
+
+def test_snapshots_of_random_changes():
+    rng = random.Random(2)
+    fib = Fib()
+    routes = []
+    snapshots = []
+    for step in range(2000):
+        if routes and rng.random() < 0.4:
+            assert fib.remove(routes.pop(rng.randrange(len(routes))))
+        else:
+            bits = rng.choice([0, 8, 16, 24, 24, 32])
+            r = Route(rng.getrandbits(32), PREFIX_MASKS[bits], rng.getrandbits(32), 'B')
+            fib.add(r)
+            routes.append(r)
+
+        if step % 100 == 0:
+            snapshots.append((fib.snapshot(), sorted(map(prefix_of, routes))))
+
+    for snapshot, expected in snapshots:
+        assert sorted(map(prefix_of, snapshot)) == expected
+        assert len(snapshot) == len(expected)
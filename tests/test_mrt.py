@@ -0,0 +1,45 @@
+import mrt
+from bgproute import BGPRoute
+from router import Router
+from tools import ip_to_int
+
+from helpers import prefix
+
+
+ROUTES = [
+    (prefix('10.0.0.0/8'), ip_to_int('172.16.0.1'), (65001, 3356)),
+    (prefix('10.1.0.0/16'), ip_to_int('172.16.0.1'), (65001, 3356, 4200000000)),
+    (prefix('192.0.2.0/24'), ip_to_int('172.16.0.2'), (65001, 174)),
+    (prefix('203.0.113.7/32'), ip_to_int('172.16.0.1'), (65001, 3356)),
+]
+
+
+def test_table_round_trip(tmp_path):
+    r = Router(65000)
+    assert r.load_bgp_routes(((n, m, hop, path) for (n, m), hop, path in ROUTES), source=65001) == len(ROUTES)
+
+    for name in ('rib.mrt', 'rib.mrt.gz', 'rib.mrt.bz2'):
+        filename = str(tmp_path / name)
+        assert mrt.dump_rib(r, filename) == len(ROUTES)
+
+        with mrt.open_dump(filename) as f:
+            read = list(mrt.read_rib(f))
+
+        assert read == [(n, m, 65001, hop, path) for (n, m), hop, path in ROUTES]
+
+
+def test_several_peers_per_prefix(tmp_path):
+    network, mask = prefix('10.0.0.0/8')
+    routes = [BGPRoute.from_ints(network, mask, ip_to_int('172.16.0.1'), (65001, 3356)),
+              BGPRoute.from_ints(network, mask, ip_to_int('172.16.0.2'), (65002, 174, 3356))]
+    peers = [(ip_to_int('172.16.0.1'), ip_to_int('172.16.0.1'), 65001),
+             (ip_to_int('172.16.0.2'), ip_to_int('172.16.0.2'), 65002)]
+    filename = str(tmp_path / 'rib.mrt')
+
+    mrt.write_rib(filename, (0, 'test', peers, {65001: 0, 65002: 1}, [((network, mask), routes)]))
+
+    for peer, (hop, path) in enumerate([(ip_to_int('172.16.0.1'), (65001, 3356)),
+                                        (ip_to_int('172.16.0.2'), (65002, 174, 3356))]):
+        with mrt.open_dump(filename) as f:
+            assert list(mrt.read_rib(f, peer)) == [(network, mask, 65001 + peer, hop, path)]
+
@@ -0,0 +1,41 @@
+import multiprocessing
+import pickle
+
+import pytest
+
+import shard
+import topology
+from route import Route
+
+
+def test_route_pickles_without_adjacency():
+    r = Route('10.0.1.0', '255.255.255.0', '100.64.0.2', 'B', adjacency=(object(), '100.64.0.2'))
+    copy = pickle.loads(pickle.dumps(r))
+
+    assert (copy.network, copy.mask, copy.gw, copy.source) == (r.network, r.mask, r.gw, r.source)
+    assert copy.adjacency is None
+
+
+@pytest.mark.parametrize('transport', ['queue', 'shm'])
+def test_two_shard_ring(transport):
+    t = topology.generate('ring', 6)
+    tables = shard.Coordinator(t, shards=2, transport=transport).run(15)
+
+    # every router knows its own three networks and the LANs of the five others
+    assert sorted(tables) == sorted(t.routers)
+    for as_id, routes in tables.items():
+        assert len(routes) == 8, as_id
+        assert sum(r.source == 'B' for r in routes) == 5, as_id
+
+
+def _failing_shard(index, *args, **kwargs):
+    args[5].wait()
+    raise SystemExit(3)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='the shard function is patched in the parent')
+def test_failed_shard_raises(monkeypatch):
+    monkeypatch.setattr(shard, 'shard_main', _failing_shard)
+
+    with pytest.raises(RuntimeError, match='exited with code 3'):
+        shard.Coordinator(topology.generate('ring', 6), shards=2).run(1)
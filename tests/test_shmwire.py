@@ -0,0 +1,114 @@
+import asyncio
+import random
+from collections import deque
+
+from shmwire import LENGTH, RING_HEADER, RingBuffer, ShmWire
+from tools import mac_to_bytes
+
+MAC1 = '02:00:00:00:00:01'
+MAC2 = '02:00:00:00:00:02'
+
+
+def ring(capacity):
+    return RingBuffer(bytearray(RING_HEADER + capacity), 0, capacity)
+
+
+def frame(size, fill):
+    return bytes([fill % 256]) * size
+
+
+def test_fifo_and_full():
+    r = ring(64)
+    assert r.read() is None
+
+    assert r.write(frame(20, 1))
+    assert r.write(frame(20, 2))
+    # 2 * 24 bytes are used, a third frame of 24 bytes does not fit
+    assert not r.write(frame(20, 3))
+
+    assert r.read() == frame(20, 1)
+    assert r.read() == frame(20, 2)
+    assert r.read() is None
+    assert len(r) == 0
+
+
+def test_wrap_with_marker():
+    r = ring(64)
+    assert r.write(frame(36, 1))
+    assert r.read() == frame(36, 1)
+
+    # 40 bytes used, 24 bytes left at the end are too few for a frame of 28 bytes, it goes to the start
+    assert r.write(frame(24, 2))
+    assert r.read() == frame(24, 2)
+    assert r.write(frame(30, 3))
+    assert r.read() == frame(30, 3)
+    assert r.read() is None
+
+
+def test_wrap_without_room_for_a_marker():
+    r = ring(64)
+    # 62 bytes used, the 2 bytes left can not hold the WRAP marker
+    assert r.write(frame(58, 1))
+    assert r.read() == frame(58, 1)
+
+    assert r.write(frame(10, 2))
+    assert r.write(frame(10, 3))
+    assert r.read() == frame(10, 2)
+    assert r.read() == frame(10, 3)
+    assert r.read() is None
+
+
+def test_wrap_waits_for_the_reader():
+    r = ring(64)
+    assert r.write(frame(28, 1))
+    assert r.write(frame(20, 2))
+    assert r.read() == frame(28, 1)
+
+    # the frame must go to the start, where the reader has freed 32 bytes, the 8 bytes at the end are skipped
+    assert not r.write(frame(30, 3))
+    assert r.write(frame(28, 3))
+    assert r.read() == frame(20, 2)
+    assert r.read() == frame(28, 3)
+
+
+def test_matches_a_queue():
+    rng = random.Random(4)
+    r = ring(256)
+    expected = deque()
+
+    for i in range(20000):
+        if rng.random() < 0.55:
+            data = frame(rng.randint(0, 60), i)
+            if r.write(data):
+                expected.append(data)
+            else:
+                # a frame is refused only when the skipped end and the frame do not fit, the skip is shorter than the frame
+                assert len(r) + 2 * (LENGTH.size + len(data)) > 256
+        else:
+            assert r.read() == (expected.popleft() if expected else None)
+
+    while expected:
+        assert r.read() == expected.popleft()
+    assert r.read() is None
+
+
+def ether(dst, src, payload):
+    return mac_to_bytes(dst) + mac_to_bytes(src) + b'\x08\x00' + payload
+
+
+def test_wire_between_two_sides():
+    w0 = ShmWire(capacity=4096)
+    w1 = ShmWire(w0.name, 1, 4096, create=False)
+    try:
+        w0.attach(MAC1)
+        w1.attach(MAC2)
+
+        w0.push(ether(MAC2, MAC1, b'ping'))
+        w1.push(ether(MAC1, MAC2, b'pong'))
+
+        assert asyncio.run(w1.pop(MAC2)) == ether(MAC2, MAC1, b'ping')
+        assert asyncio.run(w0.pop(MAC1)) == ether(MAC1, MAC2, b'pong')
+        assert asyncio.run(w0.pop(MAC1)) is None
+    finally:
+        w1.close()
+        w0.close()
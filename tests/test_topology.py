@@ -0,0 +1,33 @@
+import pytest
+
+import topology
+
+
+def reachable(t):
+    neighbours = t.neighbours()
+    start = next(iter(neighbours))
+    seen = {start}
+    todo = [start]
+    while todo:
+        for a in neighbours[todo.pop()]:
+            if a not in seen:
+                seen.add(a)
+                todo.append(a)
+
+    return seen == set(neighbours)
+
+
+@pytest.mark.parametrize('kind', sorted(topology.GENERATORS))
+def test_generated_topologies_are_connected(kind):
+    t = topology.generate(kind, 30, seed=1)
+
+    assert len(t.routers) == 30
+    assert reachable(t)
+
+
+def test_waxman_stops_drawing_when_few_pairs_are_accepted():
+    # hardly any pair is accepted, the generator gives up on the degree and joins the components
+    t = topology.generate('waxman', 40, degree=30, alpha=0.001, beta=0.5)
+
+    assert reachable(t)
+    assert len(t.links) < 40 * 30 // 2
@@ -1,13 +1,13 @@
-import ipaddress
+import atexit
+import queue
+import socket
+import struct
 import threading
 import os
 import sys
 
-from netaddr import IPAddress
 
-
-
-from scapy.compat import bytes_base64
+from scapy.compat import bytes_base64, raw
 from scapy.contrib.bgp import BGPPAAS4BytesPath, BGPPathAttr, BGPPALocalPref, BGPUpdate, BGPNLRI_IPv4, BGPPAOrigin, \
     BGPPANextHop, BGPPAMultiExitDisc
 
@@ -16,32 +16,87 @@ from scapy.layers.inet import IP, ICMP, Ether, TCP
 from scapy.modules import six
 import zlib
 
-from interface import Interface
-from wire import Wire
 
+IP_INT = struct.Struct('!I')
 
-def netmask_to_bits(mask):
-    return IPAddress(mask).netmask_bits()
+# netmask as int for every prefix length and the other way round
+NETMASKS = [(0xffffffff << (32 - bits)) & 0xffffffff for bits in range(33)]
+NETMASK_BITS = {mask: bits for bits, mask in enumerate(NETMASKS)}
+NETMASK_STRINGS = [socket.inet_ntoa(IP_INT.pack(mask)) for mask in NETMASKS]
 
 
 def ip_to_int(address):
     if isinstance(address, str):
-        return int(ipaddress.ip_address(address))
+        return IP_INT.unpack(socket.inet_aton(address))[0]
     else:
         return int(address)
 
 
 def int_to_ip(address):
-    return str(ipaddress.ip_address(address))
+    return socket.inet_ntoa(IP_INT.pack(address))
+
+
+# a whole list of addresses at once
+def ips_to_ints(addresses):
+    return list(struct.unpack(f'!{len(addresses)}I', b''.join(map(socket.inet_aton, addresses))))
+
+
+# mask as 'a.b.c.d' or int, a mask which is not contiguous counts its set bits
+def netmask_to_bits(mask):
+    mask = ip_to_int(mask)
+    bits = NETMASK_BITS.get(mask)
+    if bits is None:
+        bits = bin(mask).count('1')
+
+    return bits
 
 
 def cidr_to_netmask(cidr):
-    cidr = int(cidr)
-    mask = (0xffffffff >> (32 - cidr)) << (32 - cidr)
-    return (str((0xff000000 & mask) >> 24) + '.' +
-            str((0x00ff0000 & mask) >> 16) + '.' +
-            str((0x0000ff00 & mask) >> 8) + '.' +
-            str((0x000000ff & mask)))
+    return NETMASK_STRINGS[int(cidr)]
+
+
+# (network, mask) as 'a.b.c.d/len'
+def prefix_to_nlri(prefix):
+    return int_to_ip(prefix[0]) + '/' + str(netmask_to_bits(prefix[1]))
+
+
+# ['a.b.c.d/len'] as [(network, mask)]
+def nlri_to_prefixes(nlris):
+    networks = []
+    masks = []
+    for nlri in nlris:
+        network, bits = nlri.split('/')
+        networks.append(network)
+        masks.append(NETMASKS[int(bits)])
+
+    return list(zip(ips_to_ints(networks), masks))
+
+
+BGP_MAX_MESSAGE_LEN = 4096
+BGP_HEADER_LEN = 19
+
+
+# bytes a prefix 'a.b.c.d/len' takes in the NLRI or withdrawn routes field
+def nlri_len(nlri):
+    return 1 + (int(nlri.split('/')[1]) + 7) // 8
+
+
+# splits prefixes into chunks which fit into messages with space bytes left for NLRI
+def split_nlri(nlris, space):
+    chunk = []
+    used = 0
+    for nlri in nlris:
+        size = nlri_len(nlri)
+        if chunk and used + size > space:
+            yield chunk
+            chunk = []
+            used = 0
+
+        chunk.append(nlri)
+        used += size
+
+    if chunk:
+        yield chunk
 
 
 def craft_bgp_update(origin, as_path, next_hop, nlri):
@@ -64,15 +119,49 @@ def craft_bgp_update(origin, as_path, next_hop, nlri):
     set_localpref = BGPPathAttr(type_flags="Transitive", type_code="LOCAL_PREF",
                                 attribute=[BGPPALocalPref(local_pref=100)])
 
+    if isinstance(nlri, str):
+        nlri = [nlri]
+
     bgp_update = BGPUpdate(
         withdrawn_routes_len=0,
         path_attr=[set_origin, set_as, set_nexthop, set_med, set_localpref],
-        nlri=[BGPNLRI_IPv4(prefix=nlri)]
+        nlri=[BGPNLRI_IPv4(prefix=n) for n in nlri]
     )
 
     return bgp_update
 
 
+# as few UPDATE messages as possible announcing nlris with the same path attributes
+def craft_bgp_updates(origin, as_path, next_hop, nlris):
+    empty = craft_bgp_update(origin, as_path, next_hop, [])
+    space = BGP_MAX_MESSAGE_LEN - BGP_HEADER_LEN - len(raw(empty))
+
+    return [craft_bgp_update(origin, as_path, next_hop, chunk) for chunk in split_nlri(nlris, space)]
+
+
+def craft_bgp_withdraws(nlris):
+    space = BGP_MAX_MESSAGE_LEN - BGP_HEADER_LEN - 4
+
+    return [BGPUpdate(withdrawn_routes_len=None, withdrawn_routes=[BGPNLRI_IPv4(prefix=n) for n in chunk])
+            for chunk in split_nlri(nlris, space)]
+
+
+ETHER_BROADCAST_BYTES = b'\xff' * 6
+ETHER_TYPE_IP = b'\x08\x00'
+ETHER_TYPE_ARP = b'\x08\x06'
+ARP_HEADER = struct.Struct('!HHBBH6s4s6s4s')
+
+
+def mac_to_bytes(mac):
+    return bytes.fromhex(mac.replace(':', ''))
+
+
+# Ethernet frame with an ARP message as bytes, addresses are bytes too
+def craft_arp_frame(op, hwsrc, psrc, hwdst, pdst, dst=None):
+    return ((dst or hwdst) + hwsrc + ETHER_TYPE_ARP +
+            ARP_HEADER.pack(1, 0x0800, 6, 4, op, hwsrc, psrc, hwdst, pdst))
+
+
 def del_from_list(arr, to_del):
     for i in sorted(to_del, reverse=True):
         del arr[i]
@@ -99,11 +188,108 @@ def ip_in_network(network, mask, ip):
 
 
 
-debug_print_lock = threading.Lock()
+# Debug output.
+# A message is dropped with a single comparison when its severity is above debug_level and no router or session
+# has a level of its own in debug_levels. Nothing is formatted for a dropped message: the message is a format string
+# with its arguments, or a callable returning the text. Enabled messages are written by a background thread.
 debug_level = 1
+# key -> level, a key is a router name ('r501') or a BGP session ('501-502'), see set_debug_level()
+debug_levels = {}
+
+# records the writer failed to write, reported on stderr as they happen
+debug_write_errors = 0
+
+_debug_queue = None
+_debug_writer_pid = None
+_debug_writer_lock = threading.Lock()
+
+
+def set_debug_level(level, key=None):
+    global debug_level
+
+    if key is None:
+        debug_level = level
+    elif level is None:
+        debug_levels.pop(key, None)
+    else:
+        debug_levels[key] = level
+
+
+def _key_level(key):
+    if isinstance(key, tuple):
+        return max(debug_levels.get(k, 0) for k in key)
+
+    return debug_levels.get(key, 0)
+
+
+# key is one key or a tuple of keys, the highest level among them applies.
+# Hot paths check it first, so the arguments of a dropped message are not even built.
+def debug_enabled(severity, key=None):
+    return severity <= debug_level or (debug_levels and severity <= _key_level(key))
+
+
+# the writer must outlive a closed stdout or a bad record, debug_flush() waits for it
+def _debug_write(q):
+    global debug_write_errors
+
+    while True:
+        record = q.get()
+        try:
+            if isinstance(record, threading.Event):
+                sys.stdout.flush()
+                continue
+
+            severity, source, message, args = record
+            if args:
+                message = message % args
+            print(f'[{severity}]', source + '.', message)
+
+            if q.empty():
+                sys.stdout.flush()
+        except Exception as e:
+            debug_write_errors += 1
+            try:
+                print(f'Debug output failed ({debug_write_errors} so far): {e!r}', file=sys.stderr)
+            except Exception:
+                pass
+        finally:
+            if isinstance(record, threading.Event):
+                record.set()
+
+
+# the writer belongs to the process which started it, a forked process starts its own
+def _debug_queue_get():
+    global _debug_queue, _debug_writer_pid
+
+    pid = os.getpid()
+    if _debug_writer_pid != pid:
+        with _debug_writer_lock:
+            if _debug_writer_pid != pid:
+                _debug_queue = queue.SimpleQueue()
+                threading.Thread(target=_debug_write, args=(_debug_queue,), daemon=True).start()
+                _debug_writer_pid = pid
+
+    return _debug_queue
+
+
+def debug_message(severity, source, procedure, message, *args, key=None):
+    if severity > debug_level and not (debug_levels and severity <= _key_level(key)):
+        return
+
+    if callable(message):
+        message = message()
+
+    _debug_queue_get().put((severity, source, message, args))
+
+
+# waits until everything queued so far is written
+def debug_flush():
+    if _debug_writer_pid != os.getpid():
+        return
+
+    done = threading.Event()
+    _debug_queue.put(done)
+    done.wait()
 
 
-def debug_message(severity, source, procedure, message):
-    with debug_print_lock:
-        if severity <= debug_level:
-            print(f'[{severity}]', source + '.', message)
\ No newline at end of file
+atexit.register(debug_flush)
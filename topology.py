@@ -0,0 +1,335 @@
+import json
+import math
+import random
+
+import mrt
+from router import Router
+from interface import Interface
+from wire import Wire
+from bgp import BGP
+from tools import cidr_to_netmask, int_to_ip, ip_to_int
+from examples import add_announced_network
+from runtime import sleep
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+# Plain description of routers and the links between them.
+# It holds no running objects, so it can be sent to other processes and built there, whole or in parts.
+#
+# Topology files are JSON, or YAML when PyYAML is installed, with the same structure:
+#   {
+#     "link_pool": "100.64.0.0/10",
+#     "routers": {"501": ["20.0.0.254/16"], "502": ["30.0.0.254/16", "31.0.0.254/16"]},
+#     "links": [[501, 502], [501, 503, "10.0.1.1/30", "10.0.1.2/30"]],
+#     "events": [[30, 502, "off"], [60, 502, "on"]],
+#     "ribs": {"501": {"file": "rib.mrt.gz", "source": 65000, "advertise": true}}
+#   }
+# A link without addresses gets the next /30 from link_pool. Events are seconds after start, AS and 'on' or 'off'.
+# ribs are MRT dumps loaded into a router when it starts, the other keys go to mrt.load_rib().
+class Topology:
+    def __init__(self, link_pool='100.64.0.0/10'):
+        # as_id -> announced networks as 'a.b.c.d/len'
+        self.routers = {}
+        # (nlri1, nlri2, as1, as2), the interface of as1 gets nlri1
+        self.links = []
+        # (time, as_id, 'on' or 'off')
+        self.events = []
+        # as_id -> {'file': MRT dump, other keys are arguments of mrt.load_rib()}
+        self.ribs = {}
+
+        self.link_pool = link_pool
+        network, bits = link_pool.split('/')
+        self.__next_link = ip_to_int(network)
+        self.__link_pool_end = self.__next_link + (1 << (32 - int(bits)))
+
+    def add_router(self, as_id):
+        self.routers.setdefault(as_id, [])
+
+    def announce(self, as_id, nlri):
+        self.add_router(as_id)
+        self.routers[as_id].append(nlri)
+
+    def connect(self, nlri1, nlri2, as1, as2):
+        self.add_router(as1)
+        self.add_router(as2)
+        self.links.append((nlri1, nlri2, as1, as2))
+
+    # connects as1 and as2 over the next free /30 of the link pool
+    def link(self, as1, as2):
+        network = self.__next_link
+        if network + 4 > self.__link_pool_end:
+            raise ValueError(f'Link pool {self.link_pool} exhausted')
+
+        self.__next_link += 4
+        self.connect(int_to_ip(network + 1) + '/30', int_to_ip(network + 2) + '/30', as1, as2)
+
+    def add_event(self, time, as_id, action):
+        if action not in ('on', 'off'):
+            raise ValueError(f'Unknown event {action}')
+
+        self.events.append((time, as_id, action))
+        self.events.sort(key=lambda e: e[0])
+
+    def add_rib(self, as_id, filename, **kwargs):
+        self.add_router(as_id)
+        self.ribs[as_id] = dict(kwargs, file=filename)
+
+    def neighbours(self):
+        result = {as_id: [] for as_id in self.routers}
+        for nlri1, nlri2, as1, as2 in self.links:
+            result[as1].append(as2)
+            result[as2].append(as1)
+
+        return result
+
+    # builds the routers in as_ids (all when None) and returns {as_id: Router}.
+    # A link with only one end built gets its wire from remote_wire(link_index), None leaves it unconnected.
+    def build(self, as_ids=None, remote_wire=None):
+        if as_ids is None:
+            as_ids = self.routers.keys()
+        as_ids = set(as_ids)
+
+        routers = {}
+        for as_id in self.routers:
+            if as_id in as_ids:
+                routers[as_id] = Router(as_id)
+                for nlri in self.routers[as_id]:
+                    add_announced_network(routers[as_id], nlri)
+
+        for index, (nlri1, nlri2, as1, as2) in enumerate(self.links):
+            ends = [(nlri1, nlri2, as1, as2), (nlri2, nlri1, as2, as1)]
+            ends = [e for e in ends if e[2] in routers]
+            if not ends:
+                continue
+
+            if len(ends) == 2:
+                wire = Wire()
+            else:
+                wire = remote_wire(index) if remote_wire else None
+
+            for local_nlri, remote_nlri, local_as, remote_as in ends:
+                local_ip, bits = local_nlri.split('/')
+                i = Interface(local_ip, cidr_to_netmask(bits))
+                if wire:
+                    i.connect_wire(wire)
+
+                r = routers[local_as]
+                r.add_interface(i)
+                r.set_bgp(BGP(local_as, remote_as, local_ip, remote_nlri.split('/')[0]))
+
+        return routers
+
+    # starting a router clears its tables, so the dumps are loaded after on()
+    def __start(self, router, as_id):
+        router.on()
+        if as_id in self.ribs:
+            rib = dict(self.ribs[as_id])
+            mrt.load_rib(router, rib.pop('file'), **rib)
+
+    # builds and starts every router, plays the events and turns the routers off after time_to_run seconds
+    async def run(self, time_to_run):
+        routers = self.build()
+        for as_id, r in routers.items():
+            self.__start(r, as_id)
+
+        events = list(self.events)
+        c = 0
+        while True:
+            while events and events[0][0] <= c:
+                time, as_id, action = events.pop(0)
+                if action == 'on':
+                    self.__start(routers[as_id], as_id)
+                else:
+                    await routers[as_id].off()
+
+            c += 1
+            if c > time_to_run:
+                break
+
+            await sleep(1)
+
+        for r in routers.values():
+            await r.off()
+
+        return routers
+
+    def to_dict(self):
+        links = []
+        for nlri1, nlri2, as1, as2 in self.links:
+            links.append([as1, as2, nlri1, nlri2])
+
+        return {'link_pool': self.link_pool,
+                'routers': {str(as_id): networks for as_id, networks in self.routers.items()},
+                'links': links,
+                'events': [list(e) for e in self.events],
+                'ribs': {str(as_id): rib for as_id, rib in self.ribs.items()}}
+
+    @classmethod
+    def from_dict(cls, d):
+        t = cls(d.get('link_pool', '100.64.0.0/10'))
+
+        for as_id, networks in d.get('routers', {}).items():
+            t.add_router(int(as_id))
+            for nlri in networks or []:
+                t.announce(int(as_id), nlri)
+
+        for link in d.get('links', []):
+            if len(link) == 2:
+                t.link(int(link[0]), int(link[1]))
+            elif len(link) == 4:
+                t.connect(link[2], link[3], int(link[0]), int(link[1]))
+            else:
+                raise ValueError(f'A link is [as1, as2] or [as1, as2, nlri1, nlri2], got {link}')
+
+        for time, as_id, action in d.get('events', []):
+            t.add_event(time, int(as_id), action)
+
+        for as_id, rib in d.get('ribs', {}).items():
+            rib = dict(rib)
+            t.add_rib(int(as_id), rib.pop('file'), **rib)
+
+        return t
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            if filename.endswith(('.yaml', '.yml')):
+                if yaml is None:
+                    raise ImportError('Loading YAML topologies needs PyYAML')
+                return cls.from_dict(yaml.safe_load(f))
+
+            return cls.from_dict(json.load(f))
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            if filename.endswith(('.yaml', '.yml')):
+                if yaml is None:
+                    raise ImportError('Saving YAML topologies needs PyYAML')
+                yaml.safe_dump(self.to_dict(), f, default_flow_style=None, sort_keys=False)
+            else:
+                json.dump(self.to_dict(), f)
+
+
+def _ring(n, rng, params):
+    if n < 3:
+        return {(0, 1)} if n == 2 else set()
+
+    return {tuple(sorted((i, (i + 1) % n))) for i in range(n)}
+
+
+def _mesh(n, rng, params):
+    return {(i, j) for i in range(n) for j in range(i + 1, n)}
+
+
+# random spanning tree with random links added until the average degree is reached
+def _random(n, rng, params):
+    degree = params.get('degree', 3)
+    edges = {(rng.randrange(i), i) for i in range(1, n)}
+
+    target = min(int(n * degree / 2), n * (n - 1) // 2)
+    while len(edges) < target:
+        a, b = rng.sample(range(n), 2)
+        edges.add((min(a, b), max(a, b)))
+
+    return edges
+
+
+# scale-free graph by preferential attachment (Barabasi-Albert), every new AS buys transit from m existing ones,
+# which leaves a few large transit ASes and many stubs
+def _tiered(n, rng, params):
+    m = max(1, min(params.get('m', 2), n - 1))
+    edges = {(i, j) for i in range(m + 1) for j in range(i + 1, m + 1) if j < n}
+    # every AS appears once per link it has
+    ends = [a for e in edges for a in e]
+
+    for new in range(m + 1, n):
+        targets = set()
+        while len(targets) < m:
+            targets.add(rng.choice(ends))
+        for t in targets:
+            edges.add((t, new))
+            ends += (t, new)
+
+    return edges
+
+
+# Waxman graph on random points of the unit square, a link of length d exists with probability
+# beta * exp(-d / (alpha * L)). Links are drawn between random pairs with that acceptance probability until the
+# average degree is reached, which is linear in the number of links instead of quadratic in the number of ASes.
+# A small alpha or beta accepts few pairs, drawing stops after 100 tries per wanted link and the graph keeps the
+# links it has. Components left over are joined to their nearest neighbour.
+def _waxman(n, rng, params):
+    alpha = params.get('alpha', 0.15)
+    beta = params.get('beta', 1.0)
+    degree = params.get('degree', 3)
+    points = [(rng.random(), rng.random()) for _ in range(n)]
+    scale = alpha * math.sqrt(2)
+
+    def distance(a, b):
+        return math.hypot(points[a][0] - points[b][0], points[a][1] - points[b][1])
+
+    edges = set()
+    target = min(int(n * degree / 2), n * (n - 1) // 2)
+    for _ in range(100 * target):
+        if len(edges) >= target:
+            break
+
+        a, b = rng.sample(range(n), 2)
+        if rng.random() < beta * math.exp(-distance(a, b) / scale):
+            edges.add((min(a, b), max(a, b)))
+
+    parent = list(range(n))
+
+    def find(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    for a, b in edges:
+        parent[find(a)] = find(b)
+
+    components = {}
+    for a in range(n):
+        components.setdefault(find(a), []).append(a)
+
+    main = max(components.values(), key=len)
+    for members in components.values():
+        if members is main:
+            continue
+
+        a, b = min(((a, b) for a in members for b in rng.sample(main, min(len(main), 32))),
+                   key=lambda e: distance(*e))
+        edges.add((min(a, b), max(a, b)))
+
+    return edges
+
+
+GENERATORS = {'ring': _ring, 'mesh': _mesh, 'random': _random, 'tiered': _tiered, 'waxman': _waxman}
+
+
+# Topology of n ASes connected as kind, one of GENERATORS. AS numbers start at first_as, every AS announces
+# prefixes_per_as /24 networks taken in order from prefix_pool, the links get /30 networks from the link pool.
+# params go to the generator: degree (random, waxman), m (tiered), alpha and beta (waxman).
+def generate(kind, n, prefixes_per_as=1, seed=0, first_as=1000, prefix_pool='10.0.0.0/8', **params):
+    if kind not in GENERATORS:
+        raise ValueError(f'Unknown topology {kind}, known are {", ".join(GENERATORS)}')
+
+    network, bits = prefix_pool.split('/')
+    pool = ip_to_int(network)
+    if n * prefixes_per_as > 1 << (24 - int(bits)):
+        raise ValueError(f'Prefix pool {prefix_pool} is too small for {n * prefixes_per_as} /24 networks')
+
+    t = Topology()
+    for i in range(n):
+        for j in range(prefixes_per_as):
+            t.announce(first_as + i, int_to_ip(pool + ((i * prefixes_per_as + j) << 8) + 254) + '/24')
+
+    for a, b in sorted(GENERATORS[kind](n, random.Random(seed), params)):
+        t.link(first_as + a, first_as + b)
+
+    return t
@@ -1,43 +1,99 @@
-from scapy.layers.l2 import ARP
-from scapy.layers.inet import IP, ICMP, Ether
 from scapy.all import *
+import itertools
 import threading
-from scapy.utils import rdpcap
+from collections import deque
 
-from scapy.contrib.bgp import BGPHeader, BGPOpen, BGPUpdate, BGPPathAttr, BGPNLRI_IPv4, BGPPALocalPref, BGPKeepAlive
+import capture
+import runtime
+from stats import Counters
+from tools import mac_to_bytes, ETHER_BROADCAST_BYTES
 
 
+_wire_ids = itertools.count(1)
+
 
 class Wire:
-    def __init__(self):
-        self.container = []
+    def __init__(self, capture=None):
+        # frames are written to this capture, or to capture.default_capture when it is not set
+        self.capture = capture
         self.data_lock = threading.Lock()
+        # frames are raw Ethernet bytes, one queue and one condition per attached mac (as bytes),
+        # frames are delivered at push time
+        self.__queues = {}
+        self.__conditions = {}
+        self.counters = Counters('wire', ['frames_pushed', 'frames_delivered', 'frames_popped'],
+                                 {'frames_queued': lambda: sum(map(len, list(self.__queues.values())))},
+                                 wire=next(_wire_ids))
 
     def export_scapy(self, obj):
         import zlib
         return bytes_base64(zlib.compress(six.moves.cPickle.dumps(obj, 2), 9))
 
+    def attach(self, mac):
+        mac = mac_to_bytes(mac)
+        with self.data_lock:
+            if mac not in self.__queues:
+                self.__queues[mac] = deque()
+                self.__conditions[mac] = threading.Condition(self.data_lock)
+
+    def detach(self, mac):
+        mac = mac_to_bytes(mac)
+        with self.data_lock:
+            if mac in self.__queues:
+                runtime.notify_all(self.__conditions.pop(mac))
+                del self.__queues[mac]
+
     def push(self, data):
-        wrpcap('filtered.pcap', data, append=True)
+        c = self.capture or capture.default_capture
+        if c:
+            c.write(data)
+
+        self.counters['frames_pushed'] += 1
 
+        return self.deliver(data)
+
+    # puts the frame into the queues of the attached macs, returns True when the destination mac is attached here
+    def deliver(self, data):
+        dst = data[:6]
         with self.data_lock:
-            #self.container.append(self.export_scapy(data))
-            self.container.append(data)
+            if dst == ETHER_BROADCAST_BYTES:
+                src = data[6:12]
+                for mac, q in self.__queues.items():
+                    if mac != src:
+                        q.append(data)
+                        self.counters['frames_delivered'] += 1
+                        runtime.notify_all(self.__conditions[mac])
+            elif dst in self.__queues:
+                if dst != data[6:12]:
+                    self.__queues[dst].append(data)
+                    self.counters['frames_delivered'] += 1
+                    runtime.notify_all(self.__conditions[dst])
+                return True
+
+        return False
 
-    def pop(self, mac):
-        ret_index = None
+    # mac as bytes, or a string which is converted on every call.
+    # timeout 0 returns at once, None blocks until a frame arrives or wake() is called
+    async def pop(self, mac, timeout=0):
+        if isinstance(mac, str):
+            mac = mac_to_bytes(mac)
         with self.data_lock:
-            for i in range(len(self.container)):
-                # craft Ether packet
-                #packet = import_object(self.container[i])
-                packet = self.container[i]
-                if packet.src != mac:
-                    if packet.dst == 'ff:ff:ff:ff:ff:ff' or packet.dst == mac:
-                        ret_index = i
-                        break
-
-            if ret_index is not None:
-                #return import_object(self.container.pop(ret_index))
-                return self.container.pop(ret_index)
+            q = self.__queues.get(mac)
+            if q is None:
+                return None
+
+            if not q and timeout != 0:
+                await runtime.wait(self.__conditions[mac], timeout)
+
+            if q:
+                self.counters['frames_popped'] += 1
+                return q.popleft()
 
         return None
+
+    def wake(self, mac):
+        if isinstance(mac, str):
+            mac = mac_to_bytes(mac)
+        with self.data_lock:
+            if mac in self.__conditions:
+                runtime.notify_all(self.__conditions[mac])